@@ -10,21 +10,26 @@ import json
 import re
 import uuid
 import argparse
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from botocore.config import Config
 
 pp = pprint.PrettyPrinter(compact=True)
 parser = argparse.ArgumentParser(description='Asset Model Export Tool for SiteWise.')
 parser.add_argument('--profile', action='store', help='Credentials profile for the AWS account')
 parser.add_argument('--region', action='store', help='Specify the AWS region you would like to target')
+parser.add_argument('--workers', action='store', type=int, default=10, help='Number of models described concurrently')
 args = parser.parse_args()
 
-#Setup the AWS SiteWise boto3 client
+#Setup the AWS SiteWise boto3 client, with a connection per worker
 if args.profile:
     boto3.setup_default_session(profile_name=args.profile)
 if args.region:
-    my_config = Config(region_name=args.region)
+    my_config = Config(region_name=args.region, max_pool_connections=max(args.workers, 10))
 else:
-    my_config = Config()
+    my_config = Config(max_pool_connections=max(args.workers, 10))
 client = boto3.client('iotsitewise', config=my_config)
 
 #hierarchy lookup table to use later
@@ -33,13 +38,32 @@ hierarchy_id_lookup = {}
 property_logical_id_lookup = {}
 hierarchy_logical_id_lookup = {}
 
-#Create the base CFN dictionary that we will add to and then dump out as JSON
+#Create the base CFN dictionary, its resources are streamed out one at a time
 cfn_base ={
     'AWSTemplateFormatVersion' : '2010-09-09',
     'Description' : 'SiteWise Export',
     'Resources' : {}
 }
 
+#All the CFN shapes combined in a single filter dictionary for the first pass
+shape_filter = {
+    **asset_model_shapes.AssetModel['Properties'],
+    **asset_model_shapes.AssetModelProperty,
+    **asset_model_shapes.AssetModelCompositeModel,
+    **asset_model_shapes.PropertyType,
+    **asset_model_shapes.Transform,
+    **asset_model_shapes.ExpressionVariable,
+    **asset_model_shapes.VariableValue,
+    **asset_model_shapes.Metric,
+    **asset_model_shapes.MetricWindow,
+    **asset_model_shapes.TumblingWindow,
+    **asset_model_shapes.Attribute,
+    **asset_model_shapes.AssetModelHierarchy,
+    **asset_model_shapes.AssetModelCompositeModel,
+    **asset_model_shapes.Tag,
+    **asset_model_shapes.Ref
+}
+
 #Recursive function to do a first pass walk of the dictionary response from the describe call.
 #Function needs:
 # - an object to recurse over
@@ -117,65 +141,124 @@ def case_handler_2nd_pass(k,v):
     else:
           return v
 
-def get_models():
-    model_list = []
-    #list all the asset models
+#Find the property and hierarchy IDs referenced by the first pass shape that are not in the lookup tables yet
+def unresolved_ids(dictionary):
+    if isinstance(dictionary, dict):
+        unresolved = set()
+        if 'PropertyLogicalId' in dictionary and dictionary['PropertyLogicalId'] not in property_logical_id_lookup:
+            unresolved.add(dictionary['PropertyLogicalId'])
+        if 'HierarchyLogicalId' in dictionary and dictionary['HierarchyLogicalId'] not in hierarchy_logical_id_lookup:
+            unresolved.add(dictionary['HierarchyLogicalId'])
+        return unresolved.union(*[unresolved_ids(v) for v in dictionary.values()])
+    elif isinstance(dictionary, list):
+        return set().union(*[unresolved_ids(item) for item in dictionary])
+    else:
+        return set()
+
+#List all the asset model summaries, going over every page
+def list_models():
+    model_summaries = []
     response = client.list_asset_models()
-    for id in response['assetModelSummaries']:
+    model_summaries.extend(response['assetModelSummaries'])
+    while response.get('nextToken'):
+        response = client.list_asset_models(nextToken=response['nextToken'])
+        model_summaries.extend(response['assetModelSummaries'])
+    return model_summaries
+
+#Generator of the asset model descriptions, in the listing order. Models are described concurrently, at most
+#workers * 2 descriptions are held in memory waiting to be consumed
+def get_models(workers=10):
+    model_summaries = list_models()
+    for id in model_summaries:
         asset_model_name = id['name']
         asset_model_name = asset_model_name.replace(" ","")
         asset_model_id = id['id']
 
-        #update the hierarchy_id_lookup table (this is a side effect that should be cleaned up)
+        #update the hierarchy_id_lookup table, all the models are needed before the first Ref is made
         global hierarchy_id_lookup
         hierarchy_id_lookup.update({asset_model_id:asset_model_name})
 
-        #describe the asset model
-        asset_model_response = client.describe_asset_model(assetModelId=id['id'])
-        model_list.append(asset_model_response)
-    return model_list 
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for id in model_summaries:
+            #describe the asset model
+            pending.append(executor.submit(client.describe_asset_model, assetModelId=id['id']))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
-if __name__ == '__main__':
-    for model_detail in get_models():    
+#Generator of the CFN model resources as (model number, name, resource), the model number is its listing order. The
+#second pass of a resource runs as soon as the
+#properties and hierarchies it references (i.e. of its child models) went through the first pass, so a model waiting
+#for a model listed after it never holds back the models that do not depend on it
+def get_model_resources(workers=10):
+    #models waiting for their references by listing number, and the numbers of the models waiting for each id
+    waiting = {}
+    blocked = {}
+    for model_number, model_detail in enumerate(get_models(workers)):
         #base cfn model shape dictionary we will be building out.
         asset_model_base_cfn = {
             'Type' : 'AWS::IoTSiteWise::AssetModel',
             'Properties' : {}
         }
-        
+
         #this is a repeat of the hierarchy lookup table need to streamline
         asset_model_name = model_detail['assetModelName']
         asset_model_name = asset_model_name.replace(" ","")
 
         #Recurse over the describe response and filter/transform the response to match the CFN shape
-        asset_model_base_cfn['Properties'] = walk_dict_filter(
-            model_detail,
-            case_handler_1st_pass,
-            {
-                **asset_model_shapes.AssetModel['Properties'], 
-                **asset_model_shapes.AssetModelProperty,
-                **asset_model_shapes.AssetModelCompositeModel, 
-                **asset_model_shapes.PropertyType,
-                **asset_model_shapes.Transform,
-                **asset_model_shapes.ExpressionVariable,
-                **asset_model_shapes.VariableValue,
-                **asset_model_shapes.Metric,
-                **asset_model_shapes.MetricWindow,
-                **asset_model_shapes.TumblingWindow,
-                **asset_model_shapes.Attribute,
-                **asset_model_shapes.AssetModelHierarchy,
-                **asset_model_shapes.AssetModelCompositeModel,
-                **asset_model_shapes.Tag,
-                **asset_model_shapes.Ref
-                } 
-            )
-
-        cfn_base['Resources'].update({asset_model_name : asset_model_base_cfn})
-
-    #Create the valid cloudformation
-    #First run a second pass over the CFN structure to update cross referenced Logical IDs
-    cfn_base = walk_dict(cfn_base, case_handler_2nd_pass)
+        asset_model_base_cfn['Properties'] = walk_dict_filter(model_detail, case_handler_1st_pass, shape_filter)
+        unresolved = unresolved_ids(asset_model_base_cfn)
+        waiting[model_number] = (asset_model_name, asset_model_base_cfn, unresolved)
+        for id in unresolved:
+            blocked.setdefault(id, []).append(model_number)
+
+        #the first pass of this model may have resolved the references other models are waiting for
+        for id in [id for id in blocked if id in property_logical_id_lookup or id in hierarchy_logical_id_lookup]:
+            for waiting_number in blocked.pop(id):
+                waiting[waiting_number][2].discard(id)
+
+        #Run the second pass over the CFN structure of the resolved models to update cross referenced Logical IDs
+        for resolved_number in sorted(n for n, (_, _, ids) in waiting.items() if not ids):
+            asset_model_name, asset_model_base_cfn, _ = waiting.pop(resolved_number)
+            yield resolved_number, asset_model_name, walk_dict(asset_model_base_cfn, case_handler_2nd_pass)
 
+    #References that never resolved fail the second pass as they always did
+    for model_number, (asset_model_name, asset_model_base_cfn, _) in waiting.items():
+        yield model_number, asset_model_name, walk_dict(asset_model_base_cfn, case_handler_2nd_pass)
+
+#Write the template to out byte for byte as print(json.dumps(template, indent=1)) would with the resources added in the
+#listing order of their models. Resources come in any order as (model number, name, resource) and each one is spooled to
+#a temporary file as soon as it comes, only the names and the file offsets are kept in memory. Model names only
+#differing by their spaces end up with the same resource name, which keeps the place of the first model listed and
+#the content of the last one, as a dict update would
+def stream_template(template, resources, out=sys.stdout):
+    header = {k: v for k, v in template.items() if k != 'Resources'}
+    first_model_numbers = {}
+    spans = {}
+    with tempfile.TemporaryFile() as spool:
+        for model_number, name, resource in resources:
+            if name in first_model_numbers:
+                sys.stderr.write('Model {} has a duplicate resource name, the last model listed is kept\n'.format(name))
+            first_model_numbers[name] = min(model_number, first_model_numbers.get(name, model_number))
+            if name in spans and spans[name][0] > model_number:
+                continue
+            #shift the resource two levels to the right, newlines within strings are escaped so only the layout moves
+            data = json.dumps(resource, indent=1).replace('\n', '\n  ').encode()
+            spool.seek(0, 2)
+            spans[name] = (model_number, spool.tell(), len(data))
+            spool.write(data)
+
+        out.write(json.dumps(header, indent=1)[:-2] + ',\n "Resources": {')
+        for resource_number, name in enumerate(sorted(first_model_numbers, key=first_model_numbers.get)):
+            _, offset, length = spans[name]
+            spool.seek(offset)
+            out.write(('\n' if resource_number == 0 else ',\n') + '  ' + json.dumps(name) + ': '
+                      + spool.read(length).decode())
+        out.write('\n }\n}\n' if spans else '}\n}\n')
+
+if __name__ == '__main__':
     #print the json just output a template file: python3 AssetModelExporter.py > mytemplate.template
-    print(json.dumps(cfn_base, indent=1))
+    stream_template(cfn_base, get_model_resources(args.workers))
     
\ No newline at end of file
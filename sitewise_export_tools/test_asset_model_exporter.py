@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+#Tests of the streamed template against the template the exporter built in memory, run with:
+#python3 -m unittest test_asset_model_exporter
+
+import io
+import itertools
+import json
+import sys
+import unittest
+import uuid
+from unittest import mock
+
+#the exporter parses its arguments and creates its client when imported
+with mock.patch.object(sys, 'argv', ['asset_model_exporter.py']), mock.patch('boto3.client'):
+    import asset_model_exporter
+
+def measurement(id, name):
+    return {'id': id, 'name': name, 'dataType': 'DOUBLE', 'type': {'measurement': {}}}
+
+#Listed in this order: Mixer references a property of Motor, listed after it, so its second pass runs after Pump.
+#Pump and Pu mp both get the resource name Pump.
+MODELS = [
+    {'assetModelId': 'mixer', 'assetModelName': 'Mixer', 'assetModelDescription': 'mixer',
+     'assetModelProperties': [{'id': 'mixer-speed', 'name': 'Speed', 'dataType': 'DOUBLE', 'type': {'metric': {
+         'expression': 'avg(s)', 'window': {'tumbling': {'interval': '1h'}},
+         'variables': [{'name': 's', 'value': {'propertyId': 'motor-speed', 'hierarchyId': 'mixer-motors'}}]}}}],
+     'assetModelHierarchies': [{'id': 'mixer-motors', 'name': 'Motors', 'childAssetModelId': 'motor'}]},
+    {'assetModelId': 'pump-1', 'assetModelName': 'Pump', 'assetModelDescription': 'first pump',
+     'assetModelProperties': [measurement('pump-1-flow', 'Flow')], 'assetModelHierarchies': []},
+    {'assetModelId': 'motor', 'assetModelName': 'Motor', 'assetModelDescription': 'motor',
+     'assetModelProperties': [measurement('motor-speed', 'Speed')], 'assetModelHierarchies': []},
+    {'assetModelId': 'pump-2', 'assetModelName': 'Pu mp', 'assetModelDescription': 'second pump',
+     'assetModelProperties': [measurement('pump-2-pressure', 'Pressure')], 'assetModelHierarchies': []},
+]
+
+class FakeSiteWise:
+    def list_asset_models(self, **kwargs):
+        return {'assetModelSummaries': [{'id': model['assetModelId'], 'name': model['assetModelName']}
+                                        for model in MODELS]}
+
+    def describe_asset_model(self, assetModelId):
+        return json.loads(json.dumps(next(model for model in MODELS if model['assetModelId'] == assetModelId)))
+
+class StreamTemplateTest(unittest.TestCase):
+    def setUp(self):
+        #property logical ids get a uuid suffix, the same sequence is used by both exports
+        self.uuids = itertools.count()
+        patches = [mock.patch.object(asset_model_exporter, 'client', FakeSiteWise()),
+                   mock.patch.object(uuid, 'uuid4', lambda: uuid.UUID(int=next(self.uuids)))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.reset_lookups()
+
+    def reset_lookups(self):
+        self.uuids = itertools.count()
+        asset_model_exporter.hierarchy_id_lookup.clear()
+        asset_model_exporter.property_logical_id_lookup.clear()
+        asset_model_exporter.hierarchy_logical_id_lookup.clear()
+
+    #the template built in memory by the exporter before it was streamed
+    def baseline_template(self):
+        exporter = asset_model_exporter
+        cfn = {**exporter.cfn_base, 'Resources': {}}
+        for model in MODELS:
+            exporter.hierarchy_id_lookup.update({model['assetModelId']: model['assetModelName'].replace(' ', '')})
+        for model in FakeSiteWise().list_asset_models()['assetModelSummaries']:
+            model_detail = exporter.client.describe_asset_model(assetModelId=model['id'])
+            cfn['Resources'].update({model_detail['assetModelName'].replace(' ', ''): {
+                'Type': 'AWS::IoTSiteWise::AssetModel',
+                'Properties': exporter.walk_dict_filter(model_detail, exporter.case_handler_1st_pass,
+                                                        exporter.shape_filter)
+            }})
+        return json.dumps(exporter.walk_dict(cfn, exporter.case_handler_2nd_pass), indent=1) + '\n'
+
+    def test_streamed_template_matches_baseline(self):
+        out = io.StringIO()
+        with mock.patch.object(sys, 'stderr', io.StringIO()):
+            asset_model_exporter.stream_template(asset_model_exporter.cfn_base,
+                                                 asset_model_exporter.get_model_resources(workers=2), out)
+        self.reset_lookups()
+        expected = self.baseline_template()
+
+        self.assertEqual(out.getvalue(), expected)
+        resources = json.loads(out.getvalue())['Resources']
+        self.assertEqual(list(resources), ['Mixer', 'Pump', 'Motor'])
+        self.assertEqual(resources['Pump']['Properties']['AssetModelDescription'], 'second pump')
+
+    def test_empty_template_matches_baseline(self):
+        out = io.StringIO()
+        asset_model_exporter.stream_template(asset_model_exporter.cfn_base, iter([]), out)
+        self.assertEqual(out.getvalue(), json.dumps(asset_model_exporter.cfn_base, indent=1) + '\n')
+
+if __name__ == '__main__':
+    unittest.main()
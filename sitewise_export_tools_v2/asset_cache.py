@@ -0,0 +1,76 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import copy
+import json
+import logging
+import os
+
+logger = logging.getLogger()
+
+
+def iso_date(date) -> str:
+    """
+    Returns a SiteWise date (datetime, or string once cached) as an ISO 8601 string
+    """
+    return date if isinstance(date, str) else date.isoformat()
+
+
+def hierarchy_ids(hierarchies: list) -> list:
+    """
+    Returns the sorted ids of the hierarchies of an asset summary or definition
+    """
+    return sorted(hierarchy['id'] for hierarchy in hierarchies)
+
+
+class AssetCache:
+    """
+    File cache of asset definitions (describe_asset response) keyed by asset id. A cached definition is only used while
+    the lastUpdateDate and the hierarchy ids of the asset summary match the ones it was cached with, since a hierarchy
+    added to the asset model does not change the lastUpdateDate of its assets. The children of the hierarchies are not
+    cached, they are always listed. Tags are not cached, tagging an asset does not change its lastUpdateDate.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: JSON file the cache is loaded from, when it exists, and saved to
+        """
+        self.path = path
+        self.assets = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path) as fp:
+                self.assets = json.load(fp)
+            logger.debug(f'Loaded {len(self.assets)} cached assets from "{path}"')
+
+    def get(self, summary: dict):
+        """
+        :param summary: asset summary, as returned by list_assets or list_associated_assets
+        :return: cached asset definition, None when the asset is not cached or was updated since
+        """
+        entry = self.assets.get(summary['id'])
+        if entry is None or entry['lastUpdateDate'] != iso_date(summary['lastUpdateDate']) or \
+                entry.get('hierarchyIds') != hierarchy_ids(summary.get('hierarchies', [])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.deepcopy(entry['asset'])
+
+    def put(self, asset: dict, summary: dict = None):
+        """
+        :param asset: asset definition, its tags are not cached
+        :param summary: asset summary, the last update date of the asset definition is used without it
+        """
+        self.assets[asset['assetId']] = {
+            'lastUpdateDate': iso_date(summary['lastUpdateDate'] if summary else asset['assetLastUpdateDate']),
+            'hierarchyIds': hierarchy_ids(asset['assetHierarchies']),
+            'asset': json.loads(json.dumps({k: v for k, v in asset.items() if k != 'tags'}, default=str))
+        }
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.assets, fp)
+        os.replace(tmp_path, self.path)
+        logger.info(f'Asset cache of {len(self.assets)} assets saved at "{self.path}" '
+                    f'({self.hits} reused, {self.misses} described)')
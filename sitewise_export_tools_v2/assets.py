@@ -1,14 +1,13 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0`
+import json
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
-import boto3
-
-from shapes import asset_shapes, common_shapes
+from shapes import filters
 from utils import cfn_string, walk_dict_filter, assert_sitewise_response
-
-# Lookup tables copied over from model extraction module
-lookup_model_id, lookup_model_property = {}, {}
+from values import value_row
 
 asset_base_cfn = {
     'Type': 'AWS::IoTSiteWise::Asset',
@@ -17,31 +16,71 @@ asset_base_cfn = {
 
 logger = logging.getLogger()
 
+# maximum number of entries of a batch_get_asset_property_value request
+BATCH_GET_VALUE_ENTRIES = 128
+# assets transformed by each task of the process pool
+TRANSFORM_CHUNK_SIZE = 500
+
+# worker_session: read-only session holding the model lookup tables of each transformation worker process
+worker_session = None
+
 
 def get_top_level_assets(client) -> list:
     """
-    Queries SiteWise to retrieve the top-level assets
+    Queries SiteWise to retrieve the summaries of all the top-level assets
+    """
+    summaries = []
+    token = None
+    first_execution = True
+    while first_execution or token is not None:
+        first_execution = False
+        resp = client.list_assets(filter='TOP_LEVEL', **({'nextToken': token} if token else {}))
+        assert_sitewise_response(resp, 'list_assets')
+        token = resp.get('nextToken')
+        summaries.extend(resp['assetSummaries'])
+    return summaries
+
+
+def get_child_assets(client, asset_id: str, hierarchy_id: str) -> list:
+    """
+    Queries SiteWise to retrieve the summaries of all the child assets of an asset hierarchy
     """
-    resp = client.list_assets(filter='TOP_LEVEL')
-    assert_sitewise_response(resp, 'list_assets')
-    return resp['assetSummaries']
+    summaries = []
+    token = None
+    first_execution = True
+    while first_execution or token is not None:
+        first_execution = False
+        resp = client.list_associated_assets(assetId=asset_id, hierarchyId=hierarchy_id, traversalDirection='CHILD',
+                                             **({'nextToken': token} if token else {}))
+        assert_sitewise_response(resp, 'list_associated_assets')
+        token = resp.get('nextToken')
+        summaries.extend(resp['assetSummaries'])
+    return summaries
 
 
 def handle_asset_fields(k, v, **kwargs):
     """
     Applies a transformation over the field name (k) & values (v) in order to map the values to CFN expected format.
     """
+    session = kwargs['session']
     if k == 'assetModelId':
         # return a CFN reference to the model:
-        return {'Ref': lookup_model_id[v]}
+        return {'Ref': session.lookup_model_id[v]}
 
     if k == 'assetProperties' and isinstance(v, list):
+        model_properties = session.lookup_model_property[session.lookup_model_id[kwargs['parent']['assetModelId']]]
+        # composite model (i.e. alarm) properties are exported with the asset properties, their logical ids come from
+        # the same model lookup table
+        composite_properties = [property
+                                for composite_model in sorted(kwargs['parent'].get('assetCompositeModels', []),
+                                                              key=lambda c: c['name'])
+                                for property in sorted(composite_model['properties'], key=lambda prop: prop['name'])]
         tmp = []
-        for property in sorted(v, key=lambda prop: prop['name']):
+        for property in sorted(v, key=lambda prop: prop['name']) + composite_properties:
             propertyDoc = {
-                'LogicalId': lookup_model_property[lookup_model_id[kwargs['parent']['assetModelId']]][property['id']]
+                'LogicalId': model_properties[property['id']]
             }
-            if property['notification']['state'] == 'ENABLED':
+            if property.get('notification', {}).get('state') == 'ENABLED':
                 propertyDoc.update({'NotificationState': 'ENABLED'})
             if 'alias' in property:
                 propertyDoc.update({'Alias': property['alias']})
@@ -56,91 +95,238 @@ def handle_asset_fields(k, v, **kwargs):
         for hierarchy in v:
             for child in sorted(hierarchy['children'], key=lambda h: h['name']):
                 tmp.append({
-                    'ChildAssetId': {'Ref': cfn_string(child['name'])},
-                    'LogicalId': cfn_string(hierarchy['name'])
+                    'ChildAssetId': {'Ref': session.lookup_asset_logical_id[child['id']]},
+                    'LogicalId': session.lookup_hierarchy_logical_id[hierarchy['id']]
                 })
         return tmp
     else:
         return v
 
 
-def discover_assets(assets: list, client):
+def describe_asset(client, asset_id: str) -> dict:
+    """
+    Queries SiteWise to retrieve the asset definition and its tags
+    """
+    asset = client.describe_asset(assetId=asset_id)
+    assert_sitewise_response(asset, 'describe_asset')
+    asset.pop('ResponseMetadata')
+    return add_asset_tags(client, asset)
+
+
+def add_asset_tags(client, asset: dict) -> dict:
+    """
+    Queries SiteWise to retrieve the tags of an asset and adds them to its definition. Tags are always queried, even for
+    cached definitions, as tagging an asset does not change its lastUpdateDate.
+    """
+    asset.pop('tags', None)
+    tags = client.list_tags_for_resource(resourceArn=asset['assetArn'])
+    assert_sitewise_response(tags, 'list_tags_for_resource')
+    if len(tags['tags']):
+        tags.pop('ResponseMetadata')
+        asset.update({**tags})
+    return asset
+
+
+def discover_assets(assets: list, client, inventory=None, cache=None):
     """
     Makes IoT SiteWise API calls to extract asset definitions, tags and sub-assets (recursively), starting from the
-    assets ids in provided list.
-    :param ids: list of SiteWise Asset Ids
+    assets in provided list. Assets given by their summary (i.e. child assets) are taken from the cache instead of
+    being described again when they have not been updated since they were cached, their tags are always queried.
+    :param assets: list of SiteWise Asset Ids or asset summaries
     :param client:
+    :param inventory: optional InventoryWriter each asset is written to as soon as it is discovered
+    :param cache: optional AssetCache of the asset definitions of previous exports
     :return:
     """
     ret = []
 
-    for selected_asset_id in assets:
+    for selected_asset in assets:
+        summary = selected_asset if isinstance(selected_asset, dict) else None
+        selected_asset_id = summary['id'] if summary else selected_asset
+
+        asset = cache.get(summary) if cache and summary else None
         try:
-            asset = client.describe_asset(assetId=selected_asset_id)
+            if asset is None:
+                asset = describe_asset(client, selected_asset_id)
+                if cache:
+                    cache.put(asset, summary)
+            else:
+                add_asset_tags(client, asset)
         except Exception as e:
             logger.error(f'Failed to find assetId={selected_asset_id}: {e}')
             continue
 
-        assert_sitewise_response(asset, 'describe_asset')
-        asset.pop('ResponseMetadata')
         ret.append(asset)
 
         logger.info(f'Discovered asset "{asset["assetName"]}"')
 
-        # add tags
-        tags = client.list_tags_for_resource(resourceArn=asset['assetArn'])
-        assert_sitewise_response(tags, 'list_tags_for_resource')
-        if len(tags['tags']):
-            tags.pop('ResponseMetadata')
-            asset.update({**tags})
-
-        # add children
-        for idx, asset_hierarchy in enumerate(asset['assetHierarchies']):
-            association = client.list_associated_assets(assetId=asset['assetId'], hierarchyId=asset_hierarchy['id'],
-                                                        traversalDirection='CHILD')
-            assert_sitewise_response(association, 'list_associated_assets')
+        if inventory:
+            inventory.add_asset(asset)
 
-            asset_hierarchy['children'] = sorted(association['assetSummaries'], key=lambda child: child['name'])
-            ret.extend(discover_assets([child['id'] for child in asset_hierarchy['children']], client))
+        # add children, their summaries tell which of them need to be described again
+        for asset_hierarchy in asset['assetHierarchies']:
+            asset_hierarchy['children'] = sorted(get_child_assets(client, selected_asset_id, asset_hierarchy['id']),
+                                                 key=lambda child: child['name'])
+            ret.extend(discover_assets(asset_hierarchy['children'], client, inventory, cache))
 
     return ret
 
 
-def extract_assets(asset_ids: list, model_ids, model_properties, client=boto3.client('iotsitewise')) -> dict:
+def get_property_values(client, entries: list) -> list:
+    """
+    Queries SiteWise to retrieve the latest value of up to BATCH_GET_VALUE_ENTRIES asset properties
+    :param entries: batch_get_asset_property_value entries
+    :return: success entries, errors are logged
+    """
+    success_entries = []
+    token = None
+    first_execution = True
+    while first_execution or token is not None:
+        first_execution = False
+        resp = client.batch_get_asset_property_value(entries=entries, **({'nextToken': token} if token else {}))
+        # error entries (i.e. a deleted asset) only leave their property out of the snapshot
+        assert_sitewise_response({'ResponseMetadata': resp['ResponseMetadata']}, 'batch_get_asset_property_value')
+        for error in resp.get('errorEntries', []):
+            logger.warning(f'Failed to get the value of entry {error["entryId"]}: {error["errorMessage"]}')
+        token = resp.get('nextToken')
+        success_entries.extend(resp['successEntries'])
+    return success_entries
+
+
+def snapshot_property_values(assets: list, session, max_workers: int = 10):
+    """
+    Writes the latest value of every property of the discovered assets to the value snapshot of the session. Entries
+    are packed by BATCH_GET_VALUE_ENTRIES per request and the requests run concurrently.
+    :param assets: asset definitions returned by discover_assets
+    :param session: ExportSession holding the client, the model lookup tables and the value snapshot writer
+    """
+    properties = {}
+    for asset in assets:
+        for asset_property in asset['assetProperties']:
+            properties[str(len(properties))] = (asset, asset_property)
+
+    entries = [{'entryId': entry_id, 'assetId': asset['assetId'], 'propertyId': asset_property['id']}
+               for entry_id, (asset, asset_property) in properties.items()]
+    batches = [entries[i:i + BATCH_GET_VALUE_ENTRIES] for i in range(0, len(entries), BATCH_GET_VALUE_ENTRIES)]
+    logger.debug(f'Getting the values of {len(entries)} properties in {len(batches)} requests ...')
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(get_property_values, session.client, batch) for batch in batches]
+        for future in as_completed(futures):
+            for success_entry in future.result():
+                if not success_entry.get('assetPropertyValue'):
+                    continue
+                asset, asset_property = properties[success_entry['entryId']]
+                session.value_snapshot.write(value_row(asset, asset_property, success_entry['assetPropertyValue'],
+                                                       session.lookup_property_type.get(asset_property['id']),
+                                                       session.lookup_asset_logical_id[asset['assetId']]))
+                written += 1
+    logger.info(f'Snapshot of {written} property values taken from {len(entries)} properties')
+
+
+def transform_asset(asset: dict, session) -> tuple:
+    """
+    Maps the SiteWise definition of an asset to its CloudFormation resource
+    :return: logical id and resource
+    """
+    asset_cfn = asset_base_cfn.copy()
+    asset_name = session.lookup_asset_logical_id[asset['assetId']]
+
+    asset_cfn['Properties'] = walk_dict_filter(
+        asset,
+        handle_asset_fields,
+        shape_filter=filters.Asset,
+        parent=None,
+        session=session
+    )
+    return asset_name, asset_cfn
+
+
+def init_transform_worker(lookup_model_id: dict, lookup_model_property: dict, lookup_hierarchy_logical_id: dict,
+                          lookup_asset_logical_id: dict):
+    """
+    Initializes a transformation worker process with the lookup tables of the export, shipped once per process
+    """
+    from session import ExportSession
+
+    global worker_session
+    worker_session = ExportSession(None)
+    worker_session.lookup_model_id = lookup_model_id
+    worker_session.lookup_model_property = lookup_model_property
+    worker_session.lookup_hierarchy_logical_id = lookup_hierarchy_logical_id
+    worker_session.lookup_asset_logical_id = lookup_asset_logical_id
+
+
+def transform_asset_chunk(assets: list) -> str:
+    """
+    Transforms a chunk of assets in a worker process
+    :return: compact JSON list of [logical id, resource] fragments, in the order of the assets
+    """
+    return json.dumps([transform_asset(asset, worker_session) for asset in assets], separators=(',', ':'))
+
+
+def transform_assets(assets: list, session, processes: int) -> list:
+    """
+    Transforms the assets in chunks of TRANSFORM_CHUNK_SIZE over a pool of worker processes
+    :return: list of (logical id, resource) in the order of the assets
+    """
+    chunks = [assets[i:i + TRANSFORM_CHUNK_SIZE] for i in range(0, len(assets), TRANSFORM_CHUNK_SIZE)]
+    logger.debug(f'Transforming {len(assets)} assets in {len(chunks)} chunks over {processes} processes ...')
+
+    resources = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_transform_worker,
+                             initargs=(session.lookup_model_id, session.lookup_model_property,
+                                       session.lookup_hierarchy_logical_id, session.lookup_asset_logical_id)) as executor:
+        # map returns the chunks in submission order, whatever order the workers complete them in
+        for fragments in executor.map(transform_asset_chunk, chunks):
+            resources.extend(json.loads(fragments))
+    return resources
+
+
+def allocate_asset_logical_ids(assets: list, session):
+    """
+    Allocates the logical id of every discovered asset, and of their children, in the discovery order before any of
+    them is transformed, so assets whose names collide once normalized get the same logical ids in every export
+    """
+    for asset in assets:
+        session.lookup_asset_logical_id[asset['assetId']] = session.logical_ids.allocate(
+            asset['assetId'], cfn_string(asset['assetName']) or 'Asset')
+        for hierarchy in asset['assetHierarchies']:
+            for child in hierarchy.get('children', []):
+                session.lookup_asset_logical_id[child['id']] = session.logical_ids.allocate(
+                    child['id'], cfn_string(child['name']) or 'Asset')
+
+
+def extract_assets(asset_ids: list, session, processes: int = None) -> dict:
     """
     Extract all the SiteWise Asset definitions as CloudFormation resources
-    :param asset_ids: list of asset ids from which to recursively extract asset definitions
-    :param model_ids: reference to the lookup table of model id-to-name
-    :param model_properties: reference to the lookup table of model-to-properties
-    :param client: Boto3 IoTSiteWise client
+    :param asset_ids: list of asset ids (or asset summaries) from which to recursively extract asset definitions
+    :param session: ExportSession holding the Boto3 IoTSiteWise client and the model lookup tables
+    :param processes: number of worker processes transforming the assets, they are transformed in this process when
+    None or when there are no more than TRANSFORM_CHUNK_SIZE assets
     :return:
     """
-    global lookup_model_id, lookup_model_property
-
-    lookup_model_id, lookup_model_property = model_ids, model_properties
     cfn_resources = {}
 
     logger.debug('Scanning SiteWise Assets ...')
-    list_of_assets = discover_assets(asset_ids, client)
+    list_of_assets = discover_assets(asset_ids, session.client, session.inventory, session.asset_cache)
+    allocate_asset_logical_ids(list_of_assets, session)
+
+    if session.value_snapshot:
+        snapshot_property_values(list_of_assets, session)
+
+    if session.history_export:
+        session.history_export.export(list_of_assets, session)
+
+    if processes and len(list_of_assets) > TRANSFORM_CHUNK_SIZE:
+        cfn_resources.update(transform_assets(list_of_assets, session, processes))
+        return cfn_resources
 
+    # the assets are released as they are transformed
+    list_of_assets = deque(list_of_assets)
     while list_of_assets:
-        asset = list_of_assets.pop(0)
-
-        asset_cfn = asset_base_cfn.copy()
-        asset_name = cfn_string(asset['assetName'])
-
-        asset_cfn['Properties'] = walk_dict_filter(
-            asset,
-            handle_asset_fields,
-            shape_filter={
-                **asset_shapes.Asset['Properties'],
-                **asset_shapes.AssetHierarchy,
-                **asset_shapes.AssetProperty,
-                **common_shapes.Tag,
-                **common_shapes.Ref
-            },
-            parent=None
-        )
+        asset_name, asset_cfn = transform_asset(list_of_assets.popleft(), session)
         cfn_resources.update({asset_name: asset_cfn})
 
     return cfn_resources
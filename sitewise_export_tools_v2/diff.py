@@ -0,0 +1,253 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import sys
+import time
+
+logger = logging.getLogger()
+
+# characters read from a template at once, a value larger than the buffer is decoded once enough is read
+CHUNK_SIZE = 1 << 20
+# longest value printed by a field change, longer ones are truncated
+MAX_VALUE_LENGTH = 120
+# fields matching the items of two lists, the first one found with unique values in both lists is used
+LIST_ITEM_KEYS = ('LogicalId', 'Key', 'Name')
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+MISSING = object()
+
+
+class JsonStream:
+    """
+    Reads a JSON document one value at a time with json.JSONDecoder.raw_decode, so only the value being decoded is held
+    in memory, i.e. a single resource of a template
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size: int = CHUNK_SIZE) -> bool:
+        """
+        Drops the decoded part of the buffer and reads up to size more characters
+        :return: False at the end of the document
+        """
+        chunk = self.fp.read(size) if not self.eof else ''
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return
+
+    def expect(self, characters: str) -> str:
+        """
+        Consumes the next non-whitespace character, which must be one of characters
+        """
+        self.skip_whitespace()
+        if self.pos >= len(self.buffer) or self.buffer[self.pos] not in characters:
+            raise ValueError(f'Expected one of {characters!r} but found {self.buffer[self.pos:self.pos + 20]!r}')
+        self.pos += 1
+        return self.buffer[self.pos - 1]
+
+    def decode(self):
+        """
+        Decodes the value at the current position
+        """
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer may go on in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # the buffered value is incomplete, reading as much again as buffered keeps large values linear to decode
+            self.fill(max(CHUNK_SIZE, len(self.buffer) - self.pos))
+
+    def keys(self):
+        """
+        Generator over the keys of the object at the current position. The value of each key is decoded (or streamed)
+        by the caller before getting the next key.
+        """
+        self.expect('{')
+        self.skip_whitespace()
+        if self.buffer.startswith('}', self.pos):
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+
+def iter_resources(path: str):
+    """
+    Generator over the (logical id, resource) of a template, streamed from the file
+    """
+    with open(path) as fp:
+        stream = JsonStream(fp)
+        for key in stream.keys():
+            if key == 'Resources':
+                for logical_id in stream.keys():
+                    yield logical_id, stream.decode()
+            else:
+                stream.decode()
+
+
+def resource_hash(resource: dict) -> bytes:
+    return hashlib.blake2b(json.dumps(resource, sort_keys=True, separators=(',', ':')).encode(),
+                           digest_size=16).digest()
+
+
+def index_resources(path: str) -> dict:
+    """
+    :return: logical id to (resource type, content hash) mapping of the resources of a template
+    """
+    return {logical_id: (resource.get('Type'), resource_hash(resource))
+            for logical_id, resource in iter_resources(path)}
+
+
+def list_item_key(old: list, new: list) -> str:
+    """
+    :return: field identifying the items of both lists, None to match the items by position
+    """
+    for key in LIST_ITEM_KEYS:
+        if all(isinstance(item, dict) and isinstance(item.get(key), str) for item in old + new) and \
+                len({item[key] for item in old}) == len(old) and len({item[key] for item in new}) == len(new):
+            return key
+    return None
+
+
+def field_changes(old, new) -> list:
+    """
+    Compares two resources without recursion. List items with a unique LogicalId (or Key, or Name) are matched by it,
+    so a property added to an asset is reported as such instead of changing every following property.
+    :return: list of (path, old value, new value) of the fields that differ, MISSING when only on one side
+    """
+    changes = []
+    stack = [('', old, new)]
+    while stack:
+        path, old_value, new_value = stack.pop()
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            fields = list(old_value) + [k for k in new_value if k not in old_value]
+            for k in reversed(fields):
+                stack.append((f'{path}.{k}' if path else k, old_value.get(k, MISSING), new_value.get(k, MISSING)))
+        elif isinstance(old_value, list) and isinstance(new_value, list):
+            key = list_item_key(old_value, new_value)
+            if key:
+                old_items = {item[key]: item for item in old_value}
+                new_items = {item[key]: item for item in new_value}
+                item_ids = list(old_items) + [i for i in new_items if i not in old_items]
+                for item_id in reversed(item_ids):
+                    stack.append((f'{path}[{key}={item_id}]', old_items.get(item_id, MISSING),
+                                  new_items.get(item_id, MISSING)))
+            else:
+                for i in reversed(range(max(len(old_value), len(new_value)))):
+                    stack.append((f'{path}[{i}]', old_value[i] if i < len(old_value) else MISSING,
+                                  new_value[i] if i < len(new_value) else MISSING))
+        elif old_value != new_value:
+            changes.append((path, old_value, new_value))
+    return changes
+
+
+class TemplateDiff:
+    """
+    Structural diff of two exported templates. Both templates are streamed and indexed by logical id and content
+    hash, which tells the added, removed and changed resources. Only the changed resources of the old template are then
+    kept, while re-streaming it, to compare their fields with the new ones. Memory is proportional to the index and to
+    the changed resources, never to the whole templates.
+    """
+
+    def __init__(self, old_path: str, new_path: str):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.old_index = index_resources(old_path)
+        self.new_index = index_resources(new_path)
+        self.removed = [logical_id for logical_id in self.old_index if logical_id not in self.new_index]
+        self.added = [logical_id for logical_id in self.new_index if logical_id not in self.old_index]
+        self.changed = [logical_id for logical_id, (_, digest) in self.new_index.items()
+                        if logical_id in self.old_index and self.old_index[logical_id][1] != digest]
+
+    def changes(self):
+        """
+        Generator over the (logical id, field changes) of the changed resources, in the order of the new template
+        """
+        changed = set(self.changed)
+        if not changed:
+            return
+        old_resources = {logical_id: resource for logical_id, resource in iter_resources(self.old_path)
+                         if logical_id in changed}
+        for logical_id, resource in iter_resources(self.new_path):
+            if logical_id in old_resources:
+                yield logical_id, field_changes(old_resources.pop(logical_id), resource)
+
+
+def format_value(value) -> str:
+    text = json.dumps(value, sort_keys=True, default=str)
+    return text if len(text) <= MAX_VALUE_LENGTH else text[:MAX_VALUE_LENGTH - 3] + '...'
+
+
+def format_change(path: str, old_value, new_value) -> str:
+    if old_value is MISSING:
+        return f'+ {path}: {format_value(new_value)}'
+    if new_value is MISSING:
+        return f'- {path}: {format_value(old_value)}'
+    return f'~ {path}: {format_value(old_value)} -> {format_value(new_value)}'
+
+
+if __name__ == '__main__':
+    # the differences are printed to stdout, the logs go to stderr
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s: %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p',
+                        stream=sys.stderr)
+
+    parser = argparse.ArgumentParser(description='Template Diff Tool For SiteWise')
+    parser.add_argument('old', help='Template of the previous export')
+    parser.add_argument('new', help='Template of the new export')
+    parser.add_argument('--summary', action='store_true', default=False,
+                        help='Only list the added, removed and changed resources, without their field changes')
+    parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.debug(f'{__file__} called with arguments: {args}')
+
+    start = time.time()
+    template_diff = TemplateDiff(args.old, args.new)
+    for logical_id in template_diff.removed:
+        print(f'- {logical_id} ({template_diff.old_index[logical_id][0]})')
+    for logical_id in template_diff.added:
+        print(f'+ {logical_id} ({template_diff.new_index[logical_id][0]})')
+    if args.summary:
+        for logical_id in template_diff.changed:
+            print(f'~ {logical_id} ({template_diff.new_index[logical_id][0]})')
+    else:
+        for logical_id, changes in template_diff.changes():
+            print(f'~ {logical_id} ({template_diff.new_index[logical_id][0]})')
+            for change in changes:
+                print(f'    {format_change(*change)}')
+
+    logger.info(f'{len(template_diff.old_index)} and {len(template_diff.new_index)} resources compared in '
+                f'{time.time() - start:.2f}s: {len(template_diff.added)} added, {len(template_diff.removed)} removed '
+                f'and {len(template_diff.changed)} changed')
+    sys.exit(1 if template_diff.added or template_diff.removed or template_diff.changed else 0)
@@ -0,0 +1,125 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import logging
+import math
+import time
+
+from utils import assert_sitewise_response
+
+logger = logging.getLogger()
+
+# page sizes of the list calls made by an export, list_assets and list_associated_assets use the default page size
+LIST_ASSET_MODELS_PAGE_SIZE = 250
+LIST_ASSETS_PAGE_SIZE = 50
+LIST_ASSOCIATED_ASSETS_PAGE_SIZE = 50
+# page size of the list calls made by the estimate itself
+ESTIMATE_PAGE_SIZE = 250
+
+
+class ExportEstimator:
+    """
+    Estimates the SiteWise calls and the duration of an export before running it. Only paginated list calls are made:
+    the asset models, the top-level assets and the assets of each model, whose summaries list their hierarchies. The
+    latency of these calls is measured to project the duration of the export calls.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: Boto3 IoTSiteWise client
+        """
+        self.client = client
+        self.calls = 0
+        self.latency = 0.0
+
+    def list_all(self, operation: str, key: str, **kwargs) -> list:
+        """
+        Follows the nextToken of a list call
+        :param operation: name of the list call, i.e. 'list_assets'
+        :param key: field of the response holding the summaries
+        :return: summaries of all the pages
+        """
+        summaries = []
+        token = None
+        first_execution = True
+        while first_execution or token is not None:
+            first_execution = False
+            start = time.time()
+            resp = getattr(self.client, operation)(maxResults=ESTIMATE_PAGE_SIZE, **kwargs,
+                                                   **({'nextToken': token} if token else {}))
+            self.latency += time.time() - start
+            self.calls += 1
+            assert_sitewise_response(resp, operation)
+            summaries.extend(resp[key])
+            token = resp.get('nextToken')
+        return summaries
+
+    def count(self, include_assets: bool = True) -> dict:
+        """
+        :param include_assets: also count the assets, for exports with '-a'
+        :return: number of models, assets, top-level assets and asset hierarchies
+        """
+        models = self.list_all('list_asset_models', 'assetModelSummaries')
+        counts = {'models': len(models), 'assets': 0, 'top_level_assets': 0, 'hierarchies': 0}
+        if not include_assets:
+            return counts
+
+        counts['top_level_assets'] = len(self.list_all('list_assets', 'assetSummaries', filter='TOP_LEVEL'))
+        for model in models:
+            for asset in self.list_all('list_assets', 'assetSummaries', assetModelId=model['id'], filter='ALL'):
+                counts['assets'] += 1
+                counts['hierarchies'] += len(asset.get('hierarchies', []))
+        logger.debug(f'Counted {counts} with {self.calls} list calls')
+        return counts
+
+    def project(self, counts: dict, include_assets: bool = True, concurrency: int = 1, rate: float = None) -> dict:
+        """
+        Projects the calls of an export and its duration, each call taking the average latency of the list calls. The
+        calls of all the APIs share the concurrency, and the calls of each API are limited by the rate of that API.
+        :param counts: counts returned by count
+        :param include_assets: the export includes all the top-level assets ('-a' without asset ids)
+        :param concurrency: number of concurrent calls
+        :param rate: maximum number of calls per second of each API, None when not limited
+        :return: number of calls and duration in seconds of each API, and in total
+        """
+        calls = {
+            'list_asset_models': math.ceil(counts['models'] / LIST_ASSET_MODELS_PAGE_SIZE) or 1,
+            'describe_asset_model': counts['models'],
+            'list_tags_for_resource': counts['models'] + counts['assets'],
+        }
+        if include_assets:
+            child_assets = counts['assets'] - counts['top_level_assets']
+            calls.update({
+                'list_assets': math.ceil(counts['top_level_assets'] / LIST_ASSETS_PAGE_SIZE) or 1,
+                'describe_asset': counts['assets'],
+                # one call per hierarchy of each asset, plus the next pages of the hierarchies of many children
+                'list_associated_assets': counts['hierarchies'] + child_assets // LIST_ASSOCIATED_ASSETS_PAGE_SIZE
+            })
+
+        latency = self.latency / self.calls if self.calls else 0
+        # each API is limited by its own rate, while all of them share the concurrent calls
+        projection = {operation: {'calls': n, 'seconds': max(n * latency / concurrency, n / rate if rate else 0)}
+                      for operation, n in calls.items()}
+        total_calls = sum(calls.values())
+        projection['total'] = {'calls': total_calls,
+                               'seconds': max([total_calls * latency / concurrency] +
+                                              [projected['seconds'] for projected in projection.values()])}
+        return projection
+
+    def estimate(self, include_assets: bool = True, concurrency: int = 1, rate: float = None) -> dict:
+        """
+        Counts the resources to export and projects the calls and the duration of the export
+        """
+        counts = self.count(include_assets)
+        projection = self.project(counts, include_assets, concurrency, rate)
+        logger.info(f'{counts["models"]} models, {counts["assets"]} assets ({counts["top_level_assets"]} top-level) '
+                    f'and {counts["hierarchies"]} asset hierarchies counted with {self.calls} list calls, '
+                    f'{1000 * self.latency / self.calls if self.calls else 0:.0f}ms per call on average')
+        for operation, projected in projection.items():
+            logger.info(f'{operation}: {projected["calls"]} calls, {format_duration(projected["seconds"])}')
+        return {'counts': counts, 'projection': projection}
+
+
+def format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
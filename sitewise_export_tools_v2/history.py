@@ -0,0 +1,155 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from inventory import TABLE_WRITERS
+from utils import assert_sitewise_response
+from values import SNAPSHOT_COLUMNS, value_row
+
+logger = logging.getLogger()
+
+# maximum number of entries of a batch_get_asset_property_value_history request
+BATCH_GET_HISTORY_ENTRIES = 16
+# maximum number of values returned by each page of a batch_get_asset_property_value_history request
+BATCH_GET_HISTORY_RESULTS = 20000
+# seconds between two progress reports
+PROGRESS_INTERVAL = 30
+
+
+def parse_date(date: str) -> datetime:
+    """
+    Parses an ISO 8601 date, in UTC unless it has a time zone
+    """
+    parsed = datetime.fromisoformat(date)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def time_slices(start, end, slice_length: timedelta) -> list:
+    """
+    Splits the [start, end) time range in slices of slice_length, the last one may be shorter
+    :return: list of (slice start, slice end)
+    """
+    slices = []
+    while start < end:
+        slices.append((start, min(start + slice_length, end)))
+        start += slice_length
+    return slices
+
+
+class HistoryExporter:
+    """
+    Exports the history of the properties of the discovered assets. The time range is split in slices and the
+    (property, slice) pairs are packed by BATCH_GET_HISTORY_ENTRIES per request, all of a request in the same slice.
+    Requests run concurrently and each one streams its pages to its own part file of the slice partition, i.e.
+    history/start=20220510T000000Z/part-00003.ndjson, so memory holds a few pages at most whatever the history length.
+    """
+
+    def __init__(self, path: str, start, end, slice_length: timedelta = timedelta(days=1),
+                 history_format: str = 'ndjson', max_workers: int = 10):
+        """
+        :param path: folder the partitions are written to
+        :param start: datetime the history starts at
+        :param end: datetime the history ends at (excluded)
+        :param slice_length: time range of each slice
+        :param history_format: one of inventory.FORMATS
+        :param max_workers: maximum number of concurrent requests
+        """
+        self.path = path
+        self.slices = time_slices(start, end, slice_length)
+        self.history_format = history_format
+        self.max_workers = max_workers
+        self.points = 0
+        self.files = 0
+        self.lock = threading.Lock()
+
+    def export(self, assets: list, session):
+        """
+        :param assets: asset definitions returned by discover_assets
+        :param session: ExportSession holding the client and the model lookup tables
+        """
+        properties = [(asset, asset_property) for asset in assets for asset_property in asset['assetProperties']]
+        requests = [(slice_start, slice_end, properties[i:i + BATCH_GET_HISTORY_ENTRIES])
+                    for slice_start, slice_end in self.slices
+                    for i in range(0, len(properties), BATCH_GET_HISTORY_ENTRIES)]
+        logger.info(f'Exporting the history of {len(properties)} properties over {len(self.slices)} time slices '
+                    f'in {len(requests)} requests ...')
+
+        start = time.time()
+        last_report = start
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for idx, request in enumerate(requests):
+                pending.append(executor.submit(self.export_request, idx, *request, session))
+                # requests are submitted as they are processed, so the queue does not grow with the history length
+                if len(pending) >= self.max_workers * 2:
+                    pending.popleft().result()
+                if time.time() - last_report > PROGRESS_INTERVAL:
+                    last_report = time.time()
+                    logger.info(f'{idx + 1 - len(pending)}/{len(requests)} requests, {self.points} points, '
+                                f'{self.points / (last_report - start):.0f} points/sec')
+            while pending:
+                pending.popleft().result()
+
+        elapsed = time.time() - start
+        logger.info(f'History of {self.points} points saved in {self.files} files at "{self.path}" in {elapsed:.1f}s '
+                    f'({self.points / elapsed if elapsed else 0:.0f} points/sec)')
+
+    def export_request(self, idx: int, slice_start, slice_end, properties: list, session):
+        """
+        Gets the history of up to BATCH_GET_HISTORY_ENTRIES properties in a time slice, following nextToken until
+        every entry is complete, and writes each page as it is received
+        """
+        entries = [{
+            'entryId': str(entry_id),
+            'assetId': asset['assetId'],
+            'propertyId': asset_property['id'],
+            'startDate': slice_start,
+            'endDate': slice_end,
+            'timeOrdering': 'ASCENDING'
+        } for entry_id, (asset, asset_property) in enumerate(properties)]
+
+        writer = None
+        token = None
+        first_execution = True
+        try:
+            while first_execution or token is not None:
+                first_execution = False
+                resp = session.client.batch_get_asset_property_value_history(
+                    entries=entries, maxResults=BATCH_GET_HISTORY_RESULTS, **({'nextToken': token} if token else {}))
+                assert_sitewise_response({'ResponseMetadata': resp['ResponseMetadata']},
+                                         'batch_get_asset_property_value_history')
+                for error in resp.get('errorEntries', []):
+                    logger.warning(f'Failed to get the history of entry {error["entryId"]} from {slice_start}: '
+                                   f'{error["errorMessage"]}')
+                token = resp.get('nextToken')
+
+                for success_entry in resp['successEntries']:
+                    if not success_entry['assetPropertyValueHistory']:
+                        continue
+                    # the partition file is only created once there is something to write to it
+                    if writer is None:
+                        writer = self.create_writer(idx, slice_start)
+                    asset, asset_property = properties[int(success_entry['entryId'])]
+                    property_type = session.lookup_property_type.get(asset_property['id'])
+                    asset_logical_id = session.lookup_asset_logical_id[asset['assetId']]
+                    for property_value in success_entry['assetPropertyValueHistory']:
+                        writer.write(value_row(asset, asset_property, property_value, property_type, asset_logical_id))
+                    with self.lock:
+                        self.points += len(success_entry['assetPropertyValueHistory'])
+        finally:
+            if writer:
+                writer.close()
+
+    def create_writer(self, idx: int, slice_start):
+        partition_start = slice_start.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        partition = os.path.join(self.path, f'start={partition_start}')
+        os.makedirs(partition, exist_ok=True)
+        with self.lock:
+            self.files += 1
+        return TABLE_WRITERS[self.history_format](os.path.join(partition, f'part-{idx:05d}'), SNAPSHOT_COLUMNS)
@@ -0,0 +1,389 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import create_client, assert_sitewise_response
+
+logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s: %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    stream=sys.stdout)
+
+logging.getLogger('boto3').setLevel(logging.CRITICAL)
+logging.getLogger('botocore').setLevel(logging.CRITICAL)
+logging.getLogger('s3transfer').setLevel(logging.CRITICAL)
+logging.getLogger('urllib3').setLevel(logging.CRITICAL)
+
+logger = logging.getLogger()
+
+MODEL_TYPE = 'AWS::IoTSiteWise::AssetModel'
+ASSET_TYPE = 'AWS::IoTSiteWise::Asset'
+
+# seconds between two status checks of the resources being created or updated
+POLL_INTERVAL = 2
+# retries of a call rejected because the resource is still being created or updated, the wait doubles from
+# POLL_INTERVAL up to MAX_BACKOFF seconds between two retries
+CONFLICT_RETRIES = 10
+MAX_BACKOFF = 60
+
+
+def find_refs(value) -> set:
+    """
+    Returns the logical ids referenced by all the {'Ref': ...} found in value
+    """
+    if isinstance(value, dict):
+        if set(value.keys()) == {'Ref'}:
+            return {value['Ref']}
+        return set().union(*[find_refs(v) for v in value.values()])
+    if isinstance(value, list):
+        return set().union(*[find_refs(v) for v in value])
+    return set()
+
+
+def dependency_waves(dependencies: dict) -> list:
+    """
+    Sorts the nodes of a dependency graph in waves, the nodes of a wave only depend on nodes of previous waves
+    :param dependencies: node to the set of nodes it depends on mapping
+    :return: list of waves, each one a sorted list of nodes
+    """
+    pending = {node: set(depends_on) for node, depends_on in dependencies.items()}
+    waves = []
+    while pending:
+        wave = sorted(node for node, depends_on in pending.items() if not depends_on)
+        if not wave:
+            raise ValueError(f'Circular references between {sorted(pending)}')
+        waves.append(wave)
+        for node in wave:
+            pending.pop(node)
+        for depends_on in pending.values():
+            depends_on.difference_update(wave)
+    return waves
+
+
+def api_shape(value):
+    """
+    Converts a CloudFormation shape to the shape of the SiteWise API, i.e. {'DefaultValue': 'x'} to
+    {'defaultValue': 'x'}
+    """
+    if isinstance(value, dict):
+        return {k[0].lower() + k[1:]: api_shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [api_shape(v) for v in value]
+    return value
+
+
+def sitewise_error_code(e: Exception) -> str:
+    return getattr(e, 'response', {}).get('Error', {}).get('Code')
+
+
+class TemplateImporter:
+    """
+    Creates the models and assets of a template exported by main.py straight through the SiteWise API, without
+    CloudFormation. Models are created in waves following their ChildAssetModelId references, then all the assets are
+    created, then they are associated following their ChildAssetId references and their aliases and notifications are
+    set. The resources of a wave are created concurrently and their status is polled for all of them at once.
+    """
+
+    def __init__(self, client, template: dict, max_workers: int = 10, poll_interval: float = POLL_INTERVAL,
+                 max_backoff: float = MAX_BACKOFF):
+        """
+        :param client: Boto3 IoTSiteWise client
+        :param template: CloudFormation template exported by main.py
+        :param max_workers: maximum number of concurrent SiteWise calls
+        :param max_backoff: longest wait in seconds between two retries of a conflicting call
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.models = {k: v['Properties'] for k, v in template['Resources'].items() if v['Type'] == MODEL_TYPE}
+        self.assets = {k: v['Properties'] for k, v in template['Resources'].items() if v['Type'] == ASSET_TYPE}
+        # id_map: logical id to SiteWise id mapping of the created models and assets
+        self.id_map = {}
+        # property_ids / hierarchy_ids: model logical id to (property / hierarchy logical id to SiteWise id) mapping
+        self.property_ids = {}
+        self.hierarchy_ids = {}
+
+    def plan(self) -> dict:
+        """
+        Checks the references of the template and sorts its resources in creation waves
+        :return: model waves, asset logical ids and number of associations and property updates
+        """
+        for logical_id, resource in {**self.models, **self.assets}.items():
+            missing = find_refs(resource) - self.models.keys() - self.assets.keys()
+            if missing:
+                raise ValueError(f'{logical_id} references resources missing from the template: {sorted(missing)}')
+
+        return {
+            'model_waves': dependency_waves({k: find_refs(v) for k, v in self.models.items()}),
+            'assets': sorted(self.assets),
+            'associations': sum(len(v.get('AssetHierarchies', [])) for v in self.assets.values()),
+            'property_updates': sum(1 for v in self.assets.values() for p in v.get('AssetProperties', [])
+                                    if 'Alias' in p or 'NotificationState' in p)
+        }
+
+    def run(self, dry_run: bool = False) -> dict:
+        """
+        Imports the template
+        :param dry_run: only log the plan, without calling SiteWise
+        :return: logical id to SiteWise id mapping
+        """
+        plan = self.plan()
+        for idx, wave in enumerate(plan['model_waves']):
+            logger.info(f'Model wave {idx + 1}: {", ".join(wave)}')
+        logger.info(f'{len(plan["assets"])} assets, {plan["associations"]} associations and '
+                    f'{plan["property_updates"]} property updates')
+        if dry_run:
+            return self.id_map
+
+        start = time.time()
+        for wave in plan['model_waves']:
+            self.create_models(wave)
+        self.create_assets(plan['assets'])
+        self.associate_assets(plan['assets'])
+        self.update_asset_properties(plan['assets'])
+        logger.info(f'Imported {len(self.id_map)} resources in {time.time() - start:.1f}s')
+        return self.id_map
+
+    def call(self, operation: str, **kwargs) -> dict:
+        """
+        Calls a SiteWise operation, retrying while the resource is busy with a previous create or update, with an
+        exponential backoff from poll_interval up to max_backoff seconds
+        """
+        for retry in range(CONFLICT_RETRIES + 1):
+            try:
+                response = getattr(self.client, operation)(**kwargs)
+                assert_sitewise_response(response, operation)
+                return response
+            except Exception as e:
+                if sitewise_error_code(e) != 'ConflictingOperationException' or retry == CONFLICT_RETRIES:
+                    raise
+                time.sleep(min(self.poll_interval * 2 ** retry, self.max_backoff))
+
+    def run_concurrently(self, function, items: list):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(function, items))
+
+    def create_models(self, wave: list):
+        self.run_concurrently(self.create_model, wave)
+        self.wait_until_active('list_asset_models', 'assetModelSummaries', [{}],
+                               {self.id_map[logical_id]: logical_id for logical_id in wave})
+        self.run_concurrently(self.describe_model, wave)
+
+    def create_model(self, logical_id: str):
+        model = self.models[logical_id]
+        request = {
+            'assetModelName': model['AssetModelName'],
+            'assetModelProperties': [self.model_property(logical_id, p) for p in model.get('AssetModelProperties', [])],
+            'assetModelHierarchies': [{'name': h['Name'], 'childAssetModelId': self.id_map[h['ChildAssetModelId']['Ref']]}
+                                      for h in model.get('AssetModelHierarchies', [])],
+            'assetModelCompositeModels': [
+                {
+                    'name': c['Name'],
+                    'type': c['Type'],
+                    **({'description': c['Description']} if 'Description' in c else {}),
+                    'properties': [self.model_property(logical_id, p) for p in c.get('CompositeModelProperties', [])]
+                } for c in model.get('AssetModelCompositeModels', [])]
+        }
+        if 'AssetModelDescription' in model:
+            request['assetModelDescription'] = model['AssetModelDescription']
+        if model.get('Tags'):
+            request['tags'] = {tag['Key']: tag['Value'] for tag in model['Tags']}
+
+        response = self.call('create_asset_model', **request)
+        self.id_map[logical_id] = response['assetModelId']
+        logger.info(f'Creating model "{model["AssetModelName"]}"')
+
+    def model_property(self, model_logical_id: str, model_property: dict) -> dict:
+        """
+        Maps a CloudFormation model property to its create_asset_model shape
+        """
+        type_name = model_property['Type']['TypeName']
+        property_type = {k: v for k, v in model_property['Type'].get(type_name, {}).items() if k != 'Variables'}
+        if 'Variables' in model_property['Type'].get(type_name, {}):
+            property_type['Variables'] = [{'name': v['Name'], 'value': self.variable_value(model_logical_id, v['Value'])}
+                                          for v in model_property['Type'][type_name]['Variables']]
+        return {
+            **api_shape({k: v for k, v in model_property.items() if k not in ('LogicalId', 'Type')}),
+            'type': {type_name[0].lower() + type_name[1:]: api_shape(property_type)}
+        }
+
+    def variable_value(self, model_logical_id: str, value: dict) -> dict:
+        """
+        Maps the logical ids of an expression variable. Properties of the same model are referred to by name, as the
+        model is not created yet, and properties of a child model (already created) by their id.
+        """
+        model = self.models[model_logical_id]
+        if 'HierarchyLogicalId' not in value:
+            return {'propertyId': self.property_name(model, value['PropertyLogicalId'])}
+
+        hierarchy = next(h for h in model['AssetModelHierarchies'] if h['LogicalId'] == value['HierarchyLogicalId'])
+        child_model_logical_id = hierarchy['ChildAssetModelId']['Ref']
+        return {
+            'propertyId': self.property_ids[child_model_logical_id][value['PropertyLogicalId']],
+            'hierarchyId': hierarchy['Name']
+        }
+
+    @staticmethod
+    def property_name(model: dict, property_logical_id: str) -> str:
+        return next(p['Name'] for p in model.get('AssetModelProperties', []) if p['LogicalId'] == property_logical_id)
+
+    def describe_model(self, logical_id: str):
+        """
+        Records the SiteWise ids of the properties and hierarchies of a created model
+        """
+        model = self.models[logical_id]
+        response = self.call('describe_asset_model', assetModelId=self.id_map[logical_id])
+
+        # the properties are matched by name, composite model properties by composite model and property name
+        ids = {(None, p['name']): p['id'] for p in response['assetModelProperties']}
+        ids.update({(c['name'], p['name']): p['id'] for c in response.get('assetModelCompositeModels', [])
+                    for p in c['properties']})
+        self.property_ids[logical_id] = {p['LogicalId']: ids[(None, p['Name'])]
+                                         for p in model.get('AssetModelProperties', [])}
+        self.property_ids[logical_id].update({p['LogicalId']: ids[(c['Name'], p['Name'])]
+                                              for c in model.get('AssetModelCompositeModels', [])
+                                              for p in c.get('CompositeModelProperties', [])})
+
+        hierarchy_ids = {h['name']: h['id'] for h in response['assetModelHierarchies']}
+        self.hierarchy_ids[logical_id] = {h['LogicalId']: hierarchy_ids[h['Name']]
+                                          for h in model.get('AssetModelHierarchies', [])}
+
+    def create_assets(self, asset_logical_ids: list):
+        self.run_concurrently(self.create_asset, asset_logical_ids)
+        self.wait_for_assets(asset_logical_ids)
+
+    def create_asset(self, logical_id: str):
+        asset = self.assets[logical_id]
+        request = {'assetName': asset['AssetName'], 'assetModelId': self.id_map[asset['AssetModelId']['Ref']]}
+        if asset.get('Tags'):
+            request['tags'] = {tag['Key']: tag['Value'] for tag in asset['Tags']}
+
+        response = self.call('create_asset', **request)
+        self.id_map[logical_id] = response['assetId']
+        logger.info(f'Creating asset "{asset["AssetName"]}"')
+
+    def associate_assets(self, asset_logical_ids: list):
+        parents = [logical_id for logical_id in asset_logical_ids if self.assets[logical_id].get('AssetHierarchies')]
+        # the associations of a parent are made one after the other, as each one updates the parent asset
+        self.run_concurrently(self.associate_children, parents)
+        self.wait_for_assets(parents)
+
+    def associate_children(self, logical_id: str):
+        asset = self.assets[logical_id]
+        for association, hierarchy in enumerate(asset['AssetHierarchies']):
+            # each association updates the parent, the next one waits for it to be ACTIVE again
+            if association:
+                self.wait_for_asset(logical_id)
+            self.call('associate_assets', assetId=self.id_map[logical_id],
+                      hierarchyId=self.hierarchy_ids[asset['AssetModelId']['Ref']][hierarchy['LogicalId']],
+                      childAssetId=self.id_map[hierarchy['ChildAssetId']['Ref']])
+        logger.debug(f'Associated the {len(asset["AssetHierarchies"])} children of "{asset["AssetName"]}"')
+
+    def update_asset_properties(self, asset_logical_ids: list):
+        updated = [logical_id for logical_id in asset_logical_ids
+                   if any('Alias' in p or 'NotificationState' in p for p in self.assets[logical_id]['AssetProperties'])]
+        self.run_concurrently(self.update_asset_property, updated)
+        self.wait_for_assets(updated)
+
+    def update_asset_property(self, logical_id: str):
+        asset = self.assets[logical_id]
+        # asset properties have the ids of their model properties
+        property_ids = self.property_ids[asset['AssetModelId']['Ref']]
+        for asset_property in asset['AssetProperties']:
+            if 'Alias' in asset_property or 'NotificationState' in asset_property:
+                self.call('update_asset_property', assetId=self.id_map[logical_id],
+                          propertyId=property_ids[asset_property['LogicalId']],
+                          **({'propertyAlias': asset_property['Alias']} if 'Alias' in asset_property else {}),
+                          **({'propertyNotificationState': asset_property['NotificationState']}
+                             if 'NotificationState' in asset_property else {}))
+
+    def wait_for_asset(self, logical_id: str):
+        """
+        Waits for one asset to be ACTIVE, describing it, i.e. between two updates of the same asset
+        """
+        while True:
+            status = self.call('describe_asset', assetId=self.id_map[logical_id])['assetStatus']
+            if status['state'] == 'ACTIVE':
+                return
+            if status['state'] == 'FAILED':
+                raise RuntimeError(f'{logical_id} failed: {status.get("error", {}).get("message")}')
+            time.sleep(self.poll_interval)
+
+    def wait_for_assets(self, asset_logical_ids: list):
+        """
+        Waits for the assets to be ACTIVE, listing the assets of each of their models instead of describing each asset
+        """
+        model_ids = sorted({self.id_map[self.assets[logical_id]['AssetModelId']['Ref']]
+                            for logical_id in asset_logical_ids})
+        self.wait_until_active('list_assets', 'assetSummaries', [{'assetModelId': m} for m in model_ids],
+                               {self.id_map[logical_id]: logical_id for logical_id in asset_logical_ids})
+
+    def wait_until_active(self, operation: str, summaries_key: str, requests: list, pending: dict):
+        """
+        Polls the status of all the pending resources with paginated list calls until they are ACTIVE
+        :param requests: arguments of the list calls returning the summaries of the pending resources
+        :param pending: SiteWise id to logical id mapping of the pending resources
+        """
+        pending = dict(pending)
+        while pending:
+            time.sleep(self.poll_interval)
+            for request in requests:
+                token = None
+                first_execution = True
+                while first_execution or token is not None:
+                    first_execution = False
+                    response = self.call(operation, **request, **({'nextToken': token} if token else {}))
+                    token = response.get('nextToken')
+                    for summary in response[summaries_key]:
+                        if summary['id'] not in pending:
+                            continue
+                        if summary['status']['state'] == 'ACTIVE':
+                            pending.pop(summary['id'])
+                        elif summary['status']['state'] == 'FAILED':
+                            raise RuntimeError(f'{pending[summary["id"]]} failed: '
+                                               f'{summary["status"].get("error", {}).get("message")}')
+            logger.debug(f'Waiting for {len(pending)} resources to be active ...')
+
+
+def save_id_map(id_map: dict, path: str):
+    with open(path, 'w') as fp:
+        fp.write(json.dumps(id_map, indent=4, sort_keys=True))
+    logger.info(f'Ids of {len(id_map)} imported resources saved at "{path}"')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Asset & Model Import Tool For SiteWise')
+    parser.add_argument('template', help='CloudFormation template exported by main.py')
+    parser.add_argument('--profile', help='Credentials profile for the AWS account')
+    parser.add_argument('--region', help='Specify the AWS region you would like to target')
+    parser.add_argument('--max-workers', type=int, default=10, help='Maximum number of concurrent SiteWise calls')
+    parser.add_argument('--max-backoff', type=float, default=MAX_BACKOFF,
+                        help=f'Longest wait in seconds between two retries of a call rejected because the resource is '
+                             f'busy, the wait doubles from {POLL_INTERVAL}s (default: {MAX_BACKOFF})')
+    parser.add_argument('--id-map', metavar='FILE',
+                        help='File the logical id to SiteWise id mapping is saved to (default: <template>.ids.json)')
+    parser.add_argument('--dry-run', action='store_true', default=False,
+                        help='Only check the template and log the creation waves')
+    parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.debug(f'{__file__} called with arguments: {args}')
+
+    with open(args.template) as fp:
+        template = json.load(fp)
+
+    client = None if args.dry_run else create_client(args.profile, args.region, max(args.max_workers, 10))
+    importer = TemplateImporter(client, template, max_workers=args.max_workers, max_backoff=args.max_backoff)
+    try:
+        importer.run(dry_run=args.dry_run)
+    finally:
+        # the ids of the resources created so far are kept even when the import fails
+        if not args.dry_run:
+            save_id_map(importer.id_map, args.id_map or f'{args.template}.ids.json')
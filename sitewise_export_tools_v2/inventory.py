@@ -0,0 +1,190 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import csv
+import json
+import logging
+import os
+
+logger = logging.getLogger()
+
+# columns of each inventory table
+TABLES = {
+    'models': ['model_id', 'name', 'description', 'arn', 'state', 'tags'],
+    'properties': ['model_id', 'property_id', 'name', 'composite_model', 'property_type', 'data_type', 'unit',
+                   'expression'],
+    'hierarchies': ['model_id', 'hierarchy_id', 'name', 'child_model_id'],
+    'assets': ['asset_id', 'name', 'model_id', 'arn', 'state', 'tags'],
+    'aliases': ['alias', 'asset_id', 'property_id'],
+    'asset_properties': ['asset_id', 'property_id', 'name', 'composite_model', 'data_type', 'unit', 'alias',
+                         'notification_state']
+}
+
+FORMATS = ['ndjson', 'csv', 'parquet']
+
+# rows buffered per table before a parquet row group is written
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+class NdjsonTableWriter:
+    """
+    Writes the rows of a table as they come, one JSON document per line
+    """
+
+    def __init__(self, path: str, columns: list):
+        self.fp = open(path + '.ndjson', 'w')
+
+    def write(self, row: dict):
+        self.fp.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.fp.close()
+
+
+class CsvTableWriter:
+    """
+    Writes the rows of a table as they come, as CSV with a header line
+    """
+
+    def __init__(self, path: str, columns: list):
+        self.fp = open(path + '.csv', 'w', newline='')
+        self.writer = csv.DictWriter(self.fp, fieldnames=columns)
+        self.writer.writeheader()
+
+    def write(self, row: dict):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.fp.close()
+
+
+class ParquetTableWriter:
+    """
+    Writes the rows of a table in parquet row groups of PARQUET_ROW_GROUP_SIZE rows, every column is a string
+    """
+
+    def __init__(self, path: str, columns: list):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('The parquet inventory format requires pyarrow, install it with "pip install pyarrow"')
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path + '.parquet', self.schema)
+        self.rows = []
+
+    def write(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pyarrow.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+TABLE_WRITERS = {
+    'ndjson': NdjsonTableWriter,
+    'csv': CsvTableWriter,
+    'parquet': ParquetTableWriter
+}
+
+
+def property_type(property: dict) -> str:
+    """
+    Returns the type of a model property, i.e. measurement, attribute, transform or metric
+    """
+    return next(iter(property.get('type', {})), None)
+
+
+def property_expression(property: dict) -> str:
+    return property.get('type', {}).get(property_type(property), {}).get('expression')
+
+
+def tags_string(resource: dict) -> str:
+    return json.dumps(resource['tags']) if resource.get('tags') else None
+
+
+class InventoryWriter:
+    """
+    Writes the inventory tables of the models and assets discovered by an export as they are discovered, so the
+    inventory comes from the same SiteWise calls as the CloudFormation template and no table is held in memory.
+    """
+
+    def __init__(self, path: str, inventory_format: str = 'ndjson'):
+        """
+        :param path: folder where a file is written for each table, i.e. models.ndjson
+        :param inventory_format: one of FORMATS
+        """
+        if inventory_format not in TABLE_WRITERS:
+            raise ValueError(f'Unknown inventory format "{inventory_format}", expected one of {FORMATS}')
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.inventory_format = inventory_format
+        self.writers = {table: TABLE_WRITERS[inventory_format](os.path.join(path, table), columns)
+                        for table, columns in TABLES.items()}
+        self.counts = {table: 0 for table in TABLES}
+
+    def write(self, table: str, **row):
+        self.writers[table].write({column: row.get(column) for column in TABLES[table]})
+        self.counts[table] += 1
+
+    def add_model(self, model: dict):
+        """
+        Writes the rows of a describe_asset_model response
+        """
+        model_id = model['assetModelId']
+        self.write('models', model_id=model_id, name=model['assetModelName'],
+                   description=model.get('assetModelDescription'), arn=model['assetModelArn'],
+                   state=model.get('assetModelStatus', {}).get('state'), tags=tags_string(model))
+
+        properties = [(None, property) for property in model['assetModelProperties']]
+        properties += [(composite_model['name'], property)
+                       for composite_model in model.get('assetModelCompositeModels', [])
+                       for property in composite_model.get('properties', [])]
+        for composite_model, property in properties:
+            self.write('properties', model_id=model_id, property_id=property['id'], name=property['name'],
+                       composite_model=composite_model, property_type=property_type(property),
+                       data_type=property['dataType'], unit=property.get('unit'),
+                       expression=property_expression(property))
+
+        for hierarchy in model['assetModelHierarchies']:
+            self.write('hierarchies', model_id=model_id, hierarchy_id=hierarchy['id'], name=hierarchy['name'],
+                       child_model_id=hierarchy['childAssetModelId'])
+
+    def add_asset(self, asset: dict):
+        """
+        Writes the rows of a describe_asset response
+        """
+        asset_id = asset['assetId']
+        self.write('assets', asset_id=asset_id, name=asset['assetName'], model_id=asset['assetModelId'],
+                   arn=asset['assetArn'], state=asset.get('assetStatus', {}).get('state'), tags=tags_string(asset))
+
+        properties = [(None, property) for property in asset['assetProperties']]
+        properties += [(composite_model['name'], property)
+                       for composite_model in asset.get('assetCompositeModels', [])
+                       for property in composite_model.get('properties', [])]
+        for composite_model, property in properties:
+            self.write('asset_properties', asset_id=asset_id, property_id=property['id'], name=property['name'],
+                       composite_model=composite_model, data_type=property['dataType'], unit=property.get('unit'),
+                       alias=property.get('alias'), notification_state=property.get('notification', {}).get('state'))
+            if 'alias' in property:
+                self.write('aliases', alias=property['alias'], asset_id=asset_id, property_id=property['id'])
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        logger.info(f'Inventory of {", ".join(f"{count} {table}" for table, count in self.counts.items())} '
+                    f'successfully saved at "{self.path}"')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -4,22 +4,18 @@
 import argparse
 import logging
 import sys
+from datetime import datetime, timedelta, timezone
 
-import boto3
-from botocore.config import Config
-
-from assets import extract_assets, get_top_level_assets
-from models import extract_models
-from utils import create_json_template, assert_sitewise_response
+from asset_cache import AssetCache
+from estimate import ExportEstimator
+from history import HistoryExporter, parse_date
+from inventory import InventoryWriter, FORMATS
+from session import ExportSession
+from utils import create_json_template, create_client
+from values import snapshot_writer
 
 client = None
 
-cfn_base = {
-    'AWSTemplateFormatVersion': '2010-09-09',
-    'Description': 'SiteWise Export',
-    'Resources': {}
-}
-
 logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s: %(message)s',
                     datefmt='%m/%d/%Y %I:%M:%S %p',
                     stream=sys.stdout)
@@ -32,23 +28,9 @@ logging.getLogger('urllib3').setLevel(logging.CRITICAL)
 logger = logging.getLogger()
 
 
-def extract(client, assets: list = None) -> dict:
-    cfn = cfn_base.copy()
-
-    # get all models
-    model_resources, lookup_model_id, lookup_model_property = extract_models(client)
-    cfn['Resources'].update(model_resources)
-
-    # when '-a' switch was included on the command line but no assets we're specified, retrieve all top-level assets
-    if assets is not None and len(assets) == 0:
-        logger.debug('Automatically including all top-level assets ...')
-        assets = [asset['id'] for asset in get_top_level_assets(client)]
-
-    if assets:
-        cfn_assets = extract_assets(assets, lookup_model_id, lookup_model_property, client)
-        cfn['Resources'].update(cfn_assets)
-
-    return cfn
+def extract(client, assets: list = None, inventory: InventoryWriter = None, asset_cache: AssetCache = None,
+            value_snapshot=None, history_export: HistoryExporter = None, processes: int = None) -> dict:
+    return ExportSession(client, inventory, asset_cache, value_snapshot, history_export).extract(assets, processes)
 
 
 if __name__ == '__main__':
@@ -57,23 +39,84 @@ if __name__ == '__main__':
     parser.add_argument('--region', help='Specify the AWS region you would like to target')
     parser.add_argument('-a', '--assets', required=False, metavar='ASSET_ID', nargs='*',
                         help='List of SiteWise Asset id\'s to be included and recursively exported')
+    parser.add_argument('--inventory', metavar='DIR',
+                        help='Also write the inventory tables of the exported models and assets to this folder')
+    parser.add_argument('--inventory-format', choices=FORMATS, default='ndjson',
+                        help='File format of the inventory tables (default: ndjson), parquet requires pyarrow')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='Reuse the asset definitions cached in this file by previous exports when the assets '
+                             'have not been updated since, and update it')
+    parser.add_argument('--values', metavar='FILE',
+                        help='Also write the latest value of every exported asset property to this file, replay them '
+                             'with values.py')
+    parser.add_argument('--values-format', choices=FORMATS, default='ndjson',
+                        help='File format of the property values (default: ndjson), parquet requires pyarrow')
+    parser.add_argument('--history', metavar='DIR',
+                        help='Also write the history of every exported asset property to this folder, partitioned by '
+                             'time slice')
+    parser.add_argument('--history-start', type=parse_date,
+                        help='ISO 8601 date the history starts at, required with --history (UTC unless specified)')
+    parser.add_argument('--history-end', type=parse_date, default=datetime.now(timezone.utc),
+                        help='ISO 8601 date the history ends at (default: now)')
+    parser.add_argument('--history-slice-hours', type=float, default=24,
+                        help='Hours of history of each time slice (default: 24)')
+    parser.add_argument('--history-format', choices=FORMATS, default='ndjson',
+                        help='File format of the history partitions (default: ndjson), parquet requires pyarrow')
+    parser.add_argument('--history-workers', type=int, default=10,
+                        help='Maximum number of concurrent history requests (default: 10)')
+    parser.add_argument('--processes', type=int,
+                        help='Transform large sets of assets over this many worker processes (default: in the main '
+                             'process)')
+    parser.add_argument('--estimate', action='store_true', default=False,
+                        help='Only estimate the calls and the duration of the export, from list calls')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Concurrent calls the duration is estimated with (default: 1, the export makes one call '
+                             'at a time)')
+    parser.add_argument('--rate', type=float,
+                        help='Calls per second allowed for each API by the service quotas of the account, the '
+                             'duration is estimated without limit when omitted')
     parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
     args = parser.parse_args()
+    if args.history and not args.history_start:
+        parser.error('--history requires --history-start')
 
     logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
     logger.debug(f'{__file__} called with arguments: {args}')
 
     # Setup the AWS SiteWise boto3 client
-    if args.profile:
-        boto3.setup_default_session(profile_name=args.profile)
-    if args.region:
-        my_config = Config(region_name=args.region)
-    else:
-        my_config = Config()
-    client = boto3.client('iotsitewise', config=my_config)
-
-    # Execute extraction:
-    cfn = extract(client, assets=args.assets)
+    client = create_client(args.profile, args.region, max(args.history_workers, 10))
+
+    if args.estimate:
+        if args.assets:
+            logger.warning('The estimate counts all the assets, not only the ones under the given asset ids')
+        if args.values or args.history:
+            logger.warning('The estimate does not include the property value and history calls')
+        if args.cache:
+            logger.warning('The estimate includes the describe calls saved by the asset cache')
+        ExportEstimator(client).estimate(args.assets is not None, args.concurrency, args.rate)
+        sys.exit(0)
+
+    asset_cache = AssetCache(args.cache) if args.cache else None
+    value_snapshot = snapshot_writer(args.values, args.values_format) if args.values else None
+    history_export = HistoryExporter(args.history, args.history_start, args.history_end,
+                                     timedelta(hours=args.history_slice_hours), args.history_format,
+                                     args.history_workers) if args.history else None
+
+    # Execute extraction, writing the inventory tables while the models and assets are discovered:
+    try:
+        if args.inventory:
+            with InventoryWriter(args.inventory, args.inventory_format) as inventory:
+                cfn = extract(client, assets=args.assets, inventory=inventory, asset_cache=asset_cache,
+                              value_snapshot=value_snapshot, history_export=history_export, processes=args.processes)
+        else:
+            cfn = extract(client, assets=args.assets, asset_cache=asset_cache, value_snapshot=value_snapshot,
+                          history_export=history_export, processes=args.processes)
+    finally:
+        if value_snapshot:
+            value_snapshot.close()
+
+    if asset_cache:
+        asset_cache.save()
 
     # Dump CloudFormation into a json file
     create_json_template(cfn, name='sitewise-export')
@@ -2,19 +2,8 @@
 # SPDX-License-Identifier: MIT-0
 import logging
 
-from shapes import model_shapes, common_shapes
-from utils import cfn_string, walk_dict_filter, randomize, assert_sitewise_response, title
-
-client = None
-
-# lookup_model_id: model id to model name mapping
-lookup_model_id = {}
-# lookup_property_logical_id: property id to logical id mapping
-lookup_property_logical_id = {}
-# lookup_hierarchy_logical_id: hierarchy id to logical id mapping
-lookup_hierarchy_logical_id = {}
-# lookup_model_property: model and property id to logical id mapping
-lookup_model_property = {}
+from shapes import filters
+from utils import cfn_string, walk_dict_filter, assert_sitewise_response, title, LogicalIdAllocator
 
 model_base_cfn = {
     'Type': 'AWS::IoTSiteWise::AssetModel',
@@ -24,10 +13,34 @@ model_base_cfn = {
 logger = logging.getLogger()
 
 
+def handle_model_properties(properties, current_model, session):
+    """
+    Assigns a logical id to each model (or composite model) property and records it in the session lookup tables.
+    """
+    tmp = []
+    # property logical ids only have to be unique within their model, composite model properties included
+    property_logical_ids = session.property_logical_ids.setdefault(title(current_model), LogicalIdAllocator())
+    for d in sorted(properties, key=lambda p: p['name']):
+        property_logical_id = property_logical_ids.allocate(d['id'], cfn_string(d['name']) or 'Property')
+        tmp.append({**d, **{'LogicalId': property_logical_id}})
+
+        # update the property lookup table with the id so we can use it during our second pass
+        session.lookup_property_logical_id.update({d['id']: property_logical_id})
+        session.lookup_property_type.update({d['id']: next(iter(d['type']))})
+
+        # update model_property_lookup for the current model with the new id to property_logical_id mapping
+        current_model = title(current_model)
+        if current_model not in session.lookup_model_property:
+            session.lookup_model_property[current_model] = {}
+        session.lookup_model_property[current_model][d['id']] = property_logical_id
+    return tmp
+
+
 def handle_model_fields(k, v, **kwargs):
     """
     Maps the SiteWise output definition of a model to CloudFormation model definitions.
     """
+    session = kwargs['session']
     if k == 'type' and isinstance(v, dict):
         if 'measurement' in v:
             return {'TypeName': 'Measurement'}
@@ -52,28 +65,23 @@ def handle_model_fields(k, v, **kwargs):
     if k == 'tags' and isinstance(v, dict):
         return [{'Key': tag[0], 'Value': tag[1]} for tag in v.items()]
     if k == 'assetModelProperties' and isinstance(v, list):
-        tmp = []
-        for d in sorted(v, key=lambda p: p['name']):
-            property_logical_id = randomize(d['name'])
-            tmp.append({**d, **{'LogicalId': property_logical_id}})
-
-            # update the property lookup table with the id so we can use it during our second pass
-            lookup_property_logical_id.update({d['id']: property_logical_id})
-
-            # update model_property_lookup for the current model with the new id to property_logical_id mapping
-            current_model = title(kwargs['current_model'])
-            if current_model not in lookup_model_property:
-                lookup_model_property[current_model] = {}
-            lookup_model_property[current_model][d['id']] = property_logical_id
-        return tmp
+        return handle_model_properties(v, kwargs['current_model'], session)
+    if k == 'assetModelCompositeModels' and isinstance(v, list):
+        # composite models (i.e. alarms) carry their properties in the same describe_asset_model response, so they are
+        # registered in the lookup tables alongside the model properties without any extra calls
+        return [{**d, **{'compositeModelProperties': handle_model_properties(d.get('properties', []),
+                                                                             kwargs['current_model'], session)}}
+                for d in sorted(v, key=lambda c: c['name'])]
     if k == 'assetModelHierarchies' and isinstance(v, list):
         tmp = []
+        # hierarchy logical ids only have to be unique within their model
+        hierarchy_logical_ids = LogicalIdAllocator()
         for d in sorted(v, key=lambda p: p['name']):
-            d['childAssetModelId'] = {'Ref': lookup_model_id[d['childAssetModelId']]}
-            hierarchy_logical_id = cfn_string(d['name'])
+            d['childAssetModelId'] = {'Ref': session.lookup_model_id[d['childAssetModelId']]}
+            hierarchy_logical_id = hierarchy_logical_ids.allocate(d['id'], cfn_string(d['name']) or 'Hierarchy')
             tmp.append({**d, **{'LogicalId': hierarchy_logical_id}})
             # update lookup table with the original hierarchy-id to hierarchy-logical-id mapping
-            lookup_hierarchy_logical_id.update({d['id']: hierarchy_logical_id})
+            session.lookup_hierarchy_logical_id.update({d['id']: hierarchy_logical_id})
         return tmp
 
     return v
@@ -83,12 +91,13 @@ def update_logical_ids(k, v, **kwargs):
     """
     Update the structure with logical id's of the properties and hierarchies
     """
+    session = kwargs['session']
     if k == 'Value' and isinstance(v, dict):
         if 'HierarchyLogicalId' in v and 'PropertyLogicalId' in v:
-            return {'PropertyLogicalId': lookup_property_logical_id[v['PropertyLogicalId']],
-                    'HierarchyLogicalId': lookup_hierarchy_logical_id[v['HierarchyLogicalId']]}
+            return {'PropertyLogicalId': session.lookup_property_logical_id[v['PropertyLogicalId']],
+                    'HierarchyLogicalId': session.lookup_hierarchy_logical_id[v['HierarchyLogicalId']]}
         if 'PropertyLogicalId' in v:
-            return {'PropertyLogicalId': lookup_property_logical_id[v['PropertyLogicalId']]}
+            return {'PropertyLogicalId': session.lookup_property_logical_id[v['PropertyLogicalId']]}
         else:
             return v
     else:
@@ -122,22 +131,23 @@ def find_all_models(sitewise):
             yield asset_model
 
 
-def get_models(client):
+def get_models(session):
     """
     Queries IoT SiteWise service to retrieve the model definitions
-    :param client:
+    :param session: ExportSession holding the client and the lookup tables
     :return: model definitions
     """
+    client = session.client
     model_list = []
 
     # list all the asset models
     for model in find_all_models(client):
-        asset_model_name = cfn_string(model['name'])
+        asset_model_name = cfn_string(model['name']) or 'Model'
         logger.info(f'Discovered model "{model["name"]}"')
 
-        # update the hierarchy_id_lookup table (this is a side effect that should be cleaned up)
-        global lookup_model_id
-        lookup_model_id.update({model['id']: title(asset_model_name) + 'Resource'})
+        # update the model id lookup table of the session
+        session.lookup_model_id.update(
+            {model['id']: session.logical_ids.allocate(model['id'], title(asset_model_name) + 'Resource')})
 
         # describe the asset model
         model_def = client.describe_asset_model(assetModelId=model['id'])
@@ -151,23 +161,26 @@ def get_models(client):
         if len(tags['tags']):
             model_def.update({**tags})
 
+        if session.inventory:
+            session.inventory.add_model(model_def)
+
         model_list.append(model_def)
     return model_list
 
 
-def extract_models(client):
+def extract_models(session):
     """
     Queries IoT SiteWise for Asset Models and parses the response to generate a valid CloudFormat Resources
-    :param client: Boto3 IotSIteWise client
-    :return: list of models, lookup_model_id, lookup_model_property
+    :param session: ExportSession holding the Boto3 IotSIteWise client, its lookup tables are populated
+    :return: model resources
     """
     model_resources = {}
 
     logger.debug('Scanning SiteWise models ...')
-    models = get_models(client)
+    models = get_models(session)
 
     for model in models:
-        current_model = cfn_string(model['assetModelName']) + 'Resource'
+        current_model = session.lookup_model_id[model['assetModelId']]
 
         # base cfn model shape dictionary we will be building out.
         model_cfn = model_base_cfn.copy()
@@ -176,28 +189,13 @@ def extract_models(client):
         model_cfn['Properties'] = walk_dict_filter(
             model,
             handle_model_fields,
-            shape_filter={
-                **model_shapes.AssetModel['Properties'],
-                **model_shapes.AssetModelProperty,
-                **model_shapes.AssetModelCompositeModel,
-                **model_shapes.PropertyType,
-                **model_shapes.Transform,
-                **model_shapes.ExpressionVariable,
-                **model_shapes.VariableValue,
-                **model_shapes.Metric,
-                **model_shapes.MetricWindow,
-                **model_shapes.TumblingWindow,
-                **model_shapes.Attribute,
-                **model_shapes.AssetModelHierarchy,
-                **model_shapes.AssetModelCompositeModel,
-                **common_shapes.Tag,
-                **common_shapes.Ref
-            },
-            current_model=current_model
+            shape_filter=filters.AssetModel,
+            current_model=current_model,
+            session=session
         )
         model_resources.update({current_model: model_cfn})
 
     # Run a second pass over the CFN structure to update the property and hierarchy id's
-    model_resources = walk_dict_filter(model_resources, update_logical_ids)
+    model_resources = walk_dict_filter(model_resources, update_logical_ids, session=session)
 
-    return model_resources, lookup_model_id, lookup_model_property
+    return model_resources
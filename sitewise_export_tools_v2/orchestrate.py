@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from session import ExportSession
+from utils import create_json_template, create_client
+
+logging.basicConfig(format='%(asctime)s %(processName)s %(module)s %(levelname)s: %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    stream=sys.stdout)
+
+logging.getLogger('boto3').setLevel(logging.CRITICAL)
+logging.getLogger('botocore').setLevel(logging.CRITICAL)
+logging.getLogger('s3transfer').setLevel(logging.CRITICAL)
+logging.getLogger('urllib3').setLevel(logging.CRITICAL)
+
+logger = logging.getLogger()
+
+base_export_path = 'cfnexport'
+
+
+def parse_target(target: str) -> dict:
+    """
+    Parses a PROFILE:REGION command-line target, either part may be left empty to use the configured default
+    """
+    profile, _, region = target.partition(':')
+    return {'profile': profile or None, 'region': region or None}
+
+
+def target_label(target: dict) -> str:
+    return f'{target["profile"] or "default"}-{target["region"] or "default"}'
+
+
+def unique_targets(targets: list) -> list:
+    """
+    Drops the repeated targets, keeping the first one, as targets with the same label are saved to the same folder
+    """
+    unique = {}
+    for target in targets:
+        label = target_label(target)
+        if label in unique:
+            logger.warning(f'Target {label} is listed more than once, it is exported once')
+        else:
+            unique[label] = target
+    return list(unique.values())
+
+
+def export_target(target: dict, assets: list = None, verbose: bool = False) -> dict:
+    """
+    Runs the export of one profile/region target, in its own worker process, and saves its template
+    :return: summary of the export
+    """
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    label = target_label(target)
+    summary = {**target, 'label': label, 'template': None, 'resources': 0, 'models': 0, 'assets': 0, 'error': None}
+    start = time.time()
+    try:
+        cfn = ExportSession(create_client(target['profile'], target['region'])).extract(assets)
+        create_json_template(cfn, name='sitewise-export', base_export_path=os.path.join(base_export_path, label))
+
+        resource_types = [resource['Type'] for resource in cfn['Resources'].values()]
+        summary.update({
+            'template': os.path.join(base_export_path, label, 'sitewise-export.json'),
+            'resources': len(resource_types),
+            'models': resource_types.count('AWS::IoTSiteWise::AssetModel'),
+            'assets': resource_types.count('AWS::IoTSiteWise::Asset')
+        })
+    except Exception as e:
+        logger.error(f'Export of {label} failed: {e}')
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.time() - start, 1)
+    return summary
+
+
+def orchestrate(targets: list, assets: list = None, max_workers: int = None, verbose: bool = False) -> list:
+    """
+    Exports every target concurrently, at most max_workers at a time, and writes a consolidated summary. Repeated
+    targets are exported once.
+    :return: summary of each target export
+    """
+    targets = unique_targets(targets)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(export_target, target, assets, verbose) for target in targets]
+        for future in as_completed(futures):
+            summary = future.result()
+            logger.info(f'{summary["label"]}: {summary["resources"]} resources in {summary["seconds"]}s'
+                        + (f', failed: {summary["error"]}' if summary['error'] else ''))
+            summaries.append(summary)
+
+    summaries.sort(key=lambda s: s['label'])
+    if not os.path.exists(base_export_path):
+        os.makedirs(base_export_path)
+    with open(f'{base_export_path}/summary.json', 'w') as fp:
+        fp.write(json.dumps(summaries, indent=4))
+    logger.info(f'Summary of {len(summaries)} exports saved at "{base_export_path}/summary.json"')
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-region, multi-account Asset & Model Export Tool For SiteWise')
+    parser.add_argument('-t', '--targets', metavar='PROFILE:REGION', nargs='+', default=[],
+                        help='Profile/region pairs to export, i.e. dev:us-east-1 prod:eu-west-1')
+    parser.add_argument('--targets-file',
+                        help='JSON file with a list of {"profile": ..., "region": ...} targets to export')
+    parser.add_argument('-a', '--assets', required=False, metavar='ASSET_ID', nargs='*',
+                        help='Export the assets too, all the top-level assets when no ids are given')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(),
+                        help='Maximum number of targets exported at the same time')
+    parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.debug(f'{__file__} called with arguments: {args}')
+
+    targets = [parse_target(target) for target in args.targets]
+    if args.targets_file:
+        with open(args.targets_file) as fp:
+            targets.extend({'profile': t.get('profile'), 'region': t.get('region')} for t in json.load(fp))
+    if not targets:
+        parser.error('at least one target is required')
+
+    results = orchestrate(targets, assets=args.assets, max_workers=args.max_workers, verbose=args.verbose)
+    sys.exit(1 if any(result['error'] for result in results) else 0)
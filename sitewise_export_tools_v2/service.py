@@ -0,0 +1,228 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import copy
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from session import ExportSession
+from utils import create_client
+
+logging.basicConfig(format='%(asctime)s %(threadName)s %(module)s %(levelname)s: %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    stream=sys.stdout)
+
+logging.getLogger('boto3').setLevel(logging.CRITICAL)
+logging.getLogger('botocore').setLevel(logging.CRITICAL)
+logging.getLogger('s3transfer').setLevel(logging.CRITICAL)
+logging.getLogger('urllib3').setLevel(logging.CRITICAL)
+
+logger = logging.getLogger()
+
+# only read operations are cached, any other client call goes straight to SiteWise
+CACHED_OPERATIONS = ('describe_', 'list_')
+
+
+class ResponseCache:
+    """
+    Thread-safe cache of SiteWise responses that expire ttl seconds after they are stored. At most max_entries
+    responses are kept, the least recently used ones are evicted first, and the expired responses are purged at most
+    once per ttl when a response is stored.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # entries: key to (expiry, response), from the least to the most recently used
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.next_purge = time.monotonic() + ttl
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            # the export handlers change the responses they get, every caller gets its own copy
+            return copy.deepcopy(entry[1])
+
+    def put(self, key, response):
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.next_purge:
+                for expired_key in [k for k, (expiry, _) in self.entries.items() if expiry < now]:
+                    del self.entries[expired_key]
+                self.next_purge = now + self.ttl
+            self.entries[key] = (now + self.ttl, copy.deepcopy(response))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'ttl': self.ttl}
+
+
+class CachingClient:
+    """
+    Wraps a Boto3 IoTSiteWise client so the responses of its describe and list calls are served from a ResponseCache
+    """
+
+    def __init__(self, client, cache: ResponseCache):
+        self.client = client
+        self.cache = cache
+
+    def __getattr__(self, name):
+        operation = getattr(self.client, name)
+        if not name.startswith(CACHED_OPERATIONS):
+            return operation
+
+        def cached_operation(**kwargs):
+            key = (name, json.dumps(kwargs, sort_keys=True, default=str))
+            response = self.cache.get(key)
+            if response is None:
+                response = operation(**kwargs)
+                self.cache.put(key, response)
+                response = copy.deepcopy(response)
+            return response
+
+        return cached_operation
+
+
+class ExportService:
+    """
+    Keeps one caching client per profile and region warm between exports. Each export request gets a fresh
+    ExportSession, so concurrent requests share the cached responses but none of the lookup tables.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, profile: str = None, region: str = None) -> CachingClient:
+        with self.lock:
+            if (profile, region) not in self.clients:
+                logger.info(f'Creating client for profile "{profile or "default"}" in region '
+                            f'"{region or "default"}"')
+                self.clients[(profile, region)] = CachingClient(create_client(profile, region),
+                                                                ResponseCache(self.ttl, self.max_entries))
+            return self.clients[(profile, region)]
+
+    def export(self, profile: str = None, region: str = None, assets: list = None) -> dict:
+        """
+        Exports the models and, optionally, the asset subtrees of a profile and region
+        :param assets: list of asset ids to recursively export, an empty list exports all the top-level assets and
+        None exports only the models
+        :return: CloudFormation template
+        """
+        start = time.time()
+        cfn = ExportSession(self.get_client(profile, region)).extract(assets)
+        logger.info(f'Exported {len(cfn["Resources"])} resources in {time.time() - start:.2f}s')
+        return cfn
+
+    def invalidate(self, profile: str = None, region: str = None):
+        """
+        Drops the cached responses of a profile and region, or of every client when none is given
+        """
+        with self.lock:
+            clients = [client for key, client in self.clients.items()
+                       if (profile is None and region is None) or key == (profile, region)]
+        for client in clients:
+            client.cache.clear()
+
+    def stats(self) -> list:
+        with self.lock:
+            clients = list(self.clients.items())
+        return [{'profile': profile, 'region': region, **client.cache.stats()}
+                for (profile, region), client in clients]
+
+
+class ExportRequestHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP API of the export service:
+        GET /stats          cache statistics of each client
+        POST /export        {"profile": ..., "region": ..., "assets": [...]} returns the CloudFormation template
+        POST /invalidate    {"profile": ..., "region": ...} drops the cached responses
+    """
+    service: ExportService = None
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.service.stats())
+        else:
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or '{}')
+        except ValueError as e:
+            self.send_json(400, {'error': f'Invalid request body: {e}'})
+            return
+
+        try:
+            if self.path == '/export':
+                self.send_json(200, self.service.export(body.get('profile'), body.get('region'), body.get('assets')))
+            elif self.path == '/invalidate':
+                self.service.invalidate(body.get('profile'), body.get('region'))
+                self.send_json(200, self.service.stats())
+            else:
+                self.send_json(404, {'error': f'Unknown path {self.path}'})
+        except Exception as e:
+            logger.error(f'{self.path} failed: {e}')
+            self.send_json(500, {'error': str(e)})
+
+    def send_json(self, status: int, document):
+        payload = json.dumps(document, indent=4).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(f'{self.address_string()} {format % args}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Asset & Model Export Service For SiteWise')
+    parser.add_argument('--host', default='127.0.0.1', help='Address the service listens on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port the service listens on (default: 8080)')
+    parser.add_argument('--ttl', type=float, default=300,
+                        help='Seconds the SiteWise responses are kept in the cache (default: 300)')
+    parser.add_argument('--max-entries', type=int, default=10000,
+                        help='Maximum number of SiteWise responses cached per profile and region, the least recently '
+                             'used ones are evicted first (default: 10000)')
+    parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.debug(f'{__file__} called with arguments: {args}')
+
+    ExportRequestHandler.service = ExportService(ttl=args.ttl, max_entries=args.max_entries)
+    server = ThreadingHTTPServer((args.host, args.port), ExportRequestHandler)
+    logger.info(f'Export service listening on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
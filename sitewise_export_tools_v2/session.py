@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import logging
+
+from assets import extract_assets, get_top_level_assets
+from models import extract_models
+from utils import LogicalIdAllocator
+
+logger = logging.getLogger()
+
+
+class ExportSession:
+    """
+    Owns the IoT SiteWise client and the lookup tables of one export. Sessions share no mutable state, so several
+    exports (i.e. one per region) can run concurrently in threads, or in asyncio tasks through asyncio.to_thread, and
+    a long-running process can create a fresh session for every export.
+    """
+
+    def __init__(self, client, inventory=None, asset_cache=None, value_snapshot=None, history_export=None):
+        """
+        :param client: Boto3 IoTSiteWise client
+        :param inventory: optional InventoryWriter the discovered models and assets are written to
+        :param asset_cache: optional AssetCache of the asset definitions of previous exports
+        :param value_snapshot: optional table writer (see values.snapshot_writer) the latest values of the exported
+        asset properties are written to
+        :param history_export: optional HistoryExporter of the history of the exported asset properties
+        """
+        self.client = client
+        self.inventory = inventory
+        self.asset_cache = asset_cache
+        self.value_snapshot = value_snapshot
+        self.history_export = history_export
+        # lookup_model_id: model id to model name mapping
+        self.lookup_model_id = {}
+        # lookup_property_logical_id: property id to logical id mapping
+        self.lookup_property_logical_id = {}
+        # lookup_hierarchy_logical_id: hierarchy id to logical id mapping
+        self.lookup_hierarchy_logical_id = {}
+        # lookup_model_property: model and property id to logical id mapping
+        self.lookup_model_property = {}
+        # lookup_property_type: property id to property type (measurement, attribute, transform or metric) mapping
+        self.lookup_property_type = {}
+        # lookup_asset_logical_id: asset id to logical id mapping
+        self.lookup_asset_logical_id = {}
+        # logical_ids: allocator of the model and asset logical ids, unique across the template
+        self.logical_ids = LogicalIdAllocator()
+        # property_logical_ids: model to allocator of its property logical ids
+        self.property_logical_ids = {}
+
+    def extract(self, assets: list = None, processes: int = None) -> dict:
+        """
+        Exports the models and, optionally, the assets as a CloudFormation template
+        :param assets: list of asset ids to recursively export, an empty list exports all the top-level assets and
+        None exports only the models
+        :param processes: number of worker processes transforming large sets of assets, None to transform them in
+        this process
+        :return: CloudFormation template
+        """
+        cfn = {
+            'AWSTemplateFormatVersion': '2010-09-09',
+            'Description': 'SiteWise Export',
+            'Resources': {}
+        }
+
+        # get all models
+        cfn['Resources'].update(extract_models(self))
+
+        # when '-a' switch was included on the command line but no assets we're specified, retrieve all top-level
+        # assets
+        if assets is not None and len(assets) == 0:
+            logger.debug('Automatically including all top-level assets ...')
+            # the summaries let cached top-level assets skip their describe calls too
+            assets = get_top_level_assets(self.client)
+
+        if assets:
+            cfn['Resources'].update(extract_assets(assets, self, processes))
+
+        return cfn
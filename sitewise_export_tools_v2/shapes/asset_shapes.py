@@ -3,8 +3,6 @@
 
 import json
 
-# until we support alarms we need to remove "AssetModelCompositeModels" from the shape.
-
 Asset = json.loads('''
 {
   "Type" : "AWS::IoTSiteWise::Asset",
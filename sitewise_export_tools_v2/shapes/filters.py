@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Precompiled shape filters, built once at import from the CloudFormation shapes of this package.
+# Each filter maps the (title-cased) name of a field to the keys allowed in the dictionaries found under it, the
+# top-level resource properties being under None. Dictionaries under a field that has no entry keep no keys.
+from types import MappingProxyType
+
+from shapes import asset_shapes, common_shapes, model_shapes
+
+
+def compile_filter(contexts: dict) -> MappingProxyType:
+    """
+    Freezes a parent field to allowed keys mapping into an immutable shape filter
+    """
+    return MappingProxyType({parent: frozenset(shape) for parent, shape in contexts.items()})
+
+
+AssetModel = compile_filter({
+    None: model_shapes.AssetModel['Properties'],
+    'AssetModelProperties': model_shapes.AssetModelProperty,
+    'AssetModelHierarchies': model_shapes.AssetModelHierarchy,
+    'AssetModelCompositeModels': model_shapes.AssetModelCompositeModel,
+    'CompositeModelProperties': model_shapes.AssetModelProperty,
+    'ChildAssetModelId': common_shapes.Ref,
+    'Type': model_shapes.PropertyType,
+    'Attribute': model_shapes.Attribute,
+    'Metric': model_shapes.Metric,
+    'Window': model_shapes.MetricWindow,
+    'Tumbling': model_shapes.TumblingWindow,
+    'Transform': model_shapes.Transform,
+    'Variables': model_shapes.ExpressionVariable,
+    'Value': model_shapes.VariableValue,
+    'Tags': common_shapes.Tag
+})
+
+Asset = compile_filter({
+    None: asset_shapes.Asset['Properties'],
+    'AssetModelId': common_shapes.Ref,
+    'AssetProperties': asset_shapes.AssetProperty,
+    'AssetHierarchies': asset_shapes.AssetHierarchy,
+    'ChildAssetId': common_shapes.Ref,
+    'Tags': common_shapes.Tag
+})
@@ -3,11 +3,11 @@
 
 import json
 
-# until we support alarms we need to remove "AssetModelCompositeModels" from the shape.
 AssetModel = json.loads('''
 {
   "Type" : "AWS::IoTSiteWise::AssetModel",
   "Properties" : {
+      "AssetModelCompositeModels" : [],
       "AssetModelDescription" : "",
       "AssetModelHierarchies" : [],
       "AssetModelName" : "",
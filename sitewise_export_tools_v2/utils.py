@@ -1,19 +1,14 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0`
+import functools
 import json
 import logging
 import os
 import re
-import uuid
 
 logger = logging.getLogger()
 
-
-def randomize(prefix: str) -> str:
-    """
-    Generates a random string from prefix, i.e. name0234214
-    """
-    return cfn_string(prefix) + uuid.uuid4().hex[:8]
+non_alphanumeric = re.compile(r'[^A-Za-z0-9]+')
 
 
 def title(string: str) -> str:
@@ -21,18 +16,74 @@ def title(string: str) -> str:
     return string[0].upper() + string[1:]
 
 
+@functools.lru_cache(maxsize=65536)
 def cfn_string(s: str) -> str:
     """
-    Converts string to a form accepted by CloudFormation
+    Converts string to a form accepted by CloudFormation, memoized as the same names come up again and again
+    """
+    return non_alphanumeric.sub('', s)
+
+
+class LogicalIdAllocator:
     """
-    return re.sub(r'[^A-Za-z0-9]+', '', s)
+    Allocates unique logical ids. Different names can normalize to the same logical id (i.e. "Pump 1" and "Pump-1" are
+    both "Pump1"), so an index of the allocated ids detects collisions in O(1): the first one keeps its logical id and
+    the next ones get a suffix taken from their key (i.e. the SiteWise id), which is the same from one export to the
+    next.
+    """
+
+    def __init__(self):
+        # lookup: key to logical id mapping
+        self.lookup = {}
+        # allocated: logical id to key mapping
+        self.allocated = {}
+
+    def allocate(self, key: str, logical_id: str) -> str:
+        """
+        :param key: unique key of the resource, a key always gets the same logical id
+        :param logical_id: wanted logical id, normalized with cfn_string
+        :return: allocated logical id
+        """
+        if key in self.lookup:
+            return self.lookup[key]
+
+        allocated_id = logical_id
+        if allocated_id in self.allocated:
+            suffix = cfn_string(key)
+            for length in (8, 16, len(suffix)):
+                allocated_id = logical_id + suffix[:length]
+                if allocated_id not in self.allocated:
+                    break
+            count = 2
+            while allocated_id in self.allocated:
+                allocated_id = f'{logical_id}{suffix}{count}'
+                count += 1
+            logger.warning(f'Logical id {logical_id} of {key} is already used by {self.allocated[logical_id]}, '
+                           f'using {allocated_id}')
+
+        self.lookup[key] = allocated_id
+        self.allocated[allocated_id] = key
+        return allocated_id
+
+
+def create_client(profile: str = None, region: str = None, max_pool_connections: int = 10):
+    """
+    Creates a Boto3 IoT SiteWise client for the credentials profile and region (the configured defaults when omitted).
+    Unlike boto3.setup_default_session it leaves the process-wide default session untouched, so clients of different
+    profiles can be used side by side.
+    :param max_pool_connections: HTTP connections of the client, at least the number of threads sharing it
+    """
+    import boto3
+    from botocore.config import Config
+
+    my_config = Config(region_name=region, max_pool_connections=max_pool_connections)
+    return boto3.Session(profile_name=profile).client('iotsitewise', config=my_config)
 
 
-def create_json_template(cfn, name='sitewise-assets-and-models'):
+def create_json_template(cfn, name='sitewise-assets-and-models', base_export_path='cfnexport'):
     """
     Saves the dictionary as a json file.
     """
-    base_export_path = 'cfnexport'
     logger.info(
         f'CloudFormation template of {len(cfn["Resources"])} resources successfully saved at "{base_export_path}/{name}.json"')
 
@@ -44,20 +95,26 @@ def create_json_template(cfn, name='sitewise-assets-and-models'):
         fp.write(cfn_template)
 
 
-def walk_dict_filter(resource, case_handler, **kwargs):
+def walk_dict_filter(resource, case_handler, shape_filter=None, context=None, **kwargs):
     """
     Goes over the fields & values of a dictionary or list and updates it by camel-casing the field name and applying a
     transformation over each field value.
+    :param shape_filter: precompiled filter (see shapes.filters) of the keys allowed under each parent field, when
+    omitted all the keys are kept
+    :param context: camel-cased name of the field holding resource, None for the top-level resource
     """
     if isinstance(resource, dict):
-        return {
-            title(k): walk_dict_filter(case_handler(k, v, **{**kwargs, 'parent': resource}), case_handler,
-                                       **kwargs) for k, v in
-            resource.items() if
-            ('shape_filter' in kwargs and title(k) in kwargs[
-                'shape_filter']) or 'shape_filter' not in kwargs}
+        allowed = None if shape_filter is None else shape_filter.get(context, frozenset())
+        filtered = {}
+        for k, v in resource.items():
+            key = title(k)
+            if allowed is None or key in allowed:
+                filtered[key] = walk_dict_filter(case_handler(k, v, **{**kwargs, 'parent': resource}), case_handler,
+                                                 shape_filter, key, **kwargs)
+        return filtered
     elif isinstance(resource, list):
-        return [walk_dict_filter(item, case_handler, **{**kwargs, 'parent': item}) for item in resource]
+        return [walk_dict_filter(item, case_handler, shape_filter, context, **{**kwargs, 'parent': item})
+                for item in resource]
 
     return resource
 
@@ -0,0 +1,314 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+logger = logging.getLogger()
+
+# CloudFormation limits, a template body larger than MAX_TEMPLATE_BODY_BYTES has to be deployed from S3
+MAX_TEMPLATE_RESOURCES = 500
+MAX_TEMPLATE_BODY_BYTES = 51200
+MAX_TEMPLATE_S3_BYTES = 1000000
+LOGICAL_ID_PATTERN = re.compile(r'^[A-Za-z0-9]{1,255}$')
+
+MODEL_TYPE = 'AWS::IoTSiteWise::AssetModel'
+ASSET_TYPE = 'AWS::IoTSiteWise::Asset'
+DASHBOARD_TYPE = 'AWS::IoTSiteWise::Dashboard'
+
+ERROR = 'ERROR'
+WARNING = 'WARNING'
+
+
+class DuplicateKeys:
+    """
+    json object_pairs_hook recording the keys found more than once in the same object, which json.load silently drops
+    """
+
+    def __init__(self):
+        # id of the object to (object, keys found more than once), the object is kept so its id is not reused
+        self.objects = {}
+
+    def __call__(self, pairs: list) -> dict:
+        obj = {}
+        duplicates = []
+        for k, v in pairs:
+            if k in obj:
+                duplicates.append(k)
+            obj[k] = v
+        if duplicates:
+            self.objects[id(obj)] = (obj, duplicates)
+        return obj
+
+    def paths(self, template) -> list:
+        """
+        Locates the duplicate keys in the template they were parsed from, without recursion so deep resources do not
+        hit the recursion limit
+        :param template: template returned by json.load
+        :return: sorted list of (resource logical id, path of the key in the resource), with a None logical id and the
+        path in the template for the keys found outside a resource
+        """
+        found = set()
+        stack = [(None, '', template)] if self.objects else []
+        while stack:
+            logical_id, path, value = stack.pop()
+            if isinstance(value, dict):
+                for key in self.objects.get(id(value), (None, []))[1]:
+                    found.add((logical_id, f'{path}.{key}' if path else key))
+                for k, v in value.items():
+                    if logical_id is None and path == 'Resources':
+                        stack.append((k, '', v))
+                    else:
+                        stack.append((logical_id, f'{path}.{k}' if path else k, v))
+            elif isinstance(value, list):
+                stack.extend((logical_id, f'{path}[{i}]', item) for i, item in enumerate(value))
+        return sorted(found, key=lambda duplicate: (duplicate[0] or '', duplicate[1]))
+
+
+def find_refs(value) -> list:
+    """
+    Returns the logical ids referenced by all the {'Ref': ...} found in value, without recursion so deep resources do
+    not hit the recursion limit
+    """
+    refs = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if len(item) == 1 and 'Ref' in item:
+                refs.append(item['Ref'])
+            else:
+                stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return refs
+
+
+def ref_of(value) -> str:
+    return value.get('Ref') if isinstance(value, dict) else None
+
+
+class TemplateValidator:
+    """
+    Validates a CloudFormation template exported by main.py or by the dashboard migrator, without calling AWS. Every
+    check is a single pass over an index of the resources, so templates of 100k resources are validated in seconds.
+    """
+
+    def __init__(self, template: dict, size: int = None, duplicate_keys: list = None):
+        """
+        :param template: parsed template
+        :param size: size in bytes of the template file
+        :param duplicate_keys: (resource logical id, path) of the keys found more than once in the same object while
+        parsing the template, as returned by DuplicateKeys.paths
+        """
+        self.resources = template.get('Resources', {})
+        self.size = size
+        self.duplicate_keys = duplicate_keys or []
+        self.findings = []
+        # models: model logical id to (property logical ids, hierarchy logical id to child model logical id) index
+        self.models = {}
+
+    def add(self, level: str, logical_id: str, message: str):
+        self.findings.append((level, logical_id, message))
+
+    def validate(self) -> list:
+        """
+        :return: list of (level, logical id, message) findings
+        """
+        self.check_limits()
+        self.index_models()
+        for logical_id, resource in self.resources.items():
+            if not LOGICAL_ID_PATTERN.match(logical_id):
+                self.add(ERROR, logical_id, 'Logical id must be alphanumeric and at most 255 characters')
+            for ref in find_refs(resource):
+                if ref not in self.resources and not ref.startswith('AWS::'):
+                    self.add(ERROR, logical_id, f'Ref to missing resource {ref}')
+
+            resource_type = resource.get('Type')
+            properties = resource.get('Properties', {})
+            if resource_type == MODEL_TYPE:
+                self.check_model(logical_id, properties)
+            elif resource_type == ASSET_TYPE:
+                self.check_asset(logical_id, properties)
+            elif resource_type == DASHBOARD_TYPE:
+                self.check_dashboard(logical_id, properties)
+
+        self.check_asset_parents()
+        self.check_model_cycles()
+        return self.findings
+
+    def check_limits(self):
+        for logical_id, path in self.duplicate_keys:
+            self.add(ERROR, logical_id, f'Key {path} defined more than once in the same object, only the last one is '
+                                        f'deployed')
+        if len(self.resources) > MAX_TEMPLATE_RESOURCES:
+            self.add(ERROR, None, f'{len(self.resources)} resources, over the limit of {MAX_TEMPLATE_RESOURCES}')
+        if self.size is not None and self.size > MAX_TEMPLATE_S3_BYTES:
+            self.add(ERROR, None, f'{self.size} bytes, over the limit of {MAX_TEMPLATE_S3_BYTES} bytes')
+        elif self.size is not None and self.size > MAX_TEMPLATE_BODY_BYTES:
+            self.add(WARNING, None, f'{self.size} bytes, over {MAX_TEMPLATE_BODY_BYTES} bytes it has to be deployed '
+                                    f'from S3')
+
+    def index_models(self):
+        for logical_id, resource in self.resources.items():
+            if resource.get('Type') != MODEL_TYPE:
+                continue
+            properties = resource.get('Properties', {})
+            property_ids = [p.get('LogicalId') for p in properties.get('AssetModelProperties', [])]
+            property_ids += [p.get('LogicalId') for c in properties.get('AssetModelCompositeModels', [])
+                             for p in c.get('CompositeModelProperties', [])]
+            hierarchies = {h.get('LogicalId'): ref_of(h.get('ChildAssetModelId'))
+                           for h in properties.get('AssetModelHierarchies', [])}
+            self.models[logical_id] = (property_ids, hierarchies)
+
+    def expect_type(self, logical_id: str, field: str, value, expected_type: str):
+        ref = ref_of(value)
+        if ref is None:
+            self.add(ERROR, logical_id, f'{field} is not a Ref')
+        elif ref in self.resources and self.resources[ref].get('Type') != expected_type:
+            self.add(ERROR, logical_id, f'{field} references {ref}, which is not a {expected_type}')
+
+    def check_model(self, logical_id: str, properties: dict):
+        property_ids, hierarchies = self.models[logical_id]
+        seen = set()
+        for property_id in property_ids:
+            if property_id in seen:
+                self.add(ERROR, logical_id, f'Property LogicalId {property_id} is used more than once')
+            seen.add(property_id)
+        if len(hierarchies) != len(properties.get('AssetModelHierarchies', [])):
+            self.add(ERROR, logical_id, 'Hierarchy LogicalIds are used more than once')
+        for hierarchy in properties.get('AssetModelHierarchies', []):
+            self.expect_type(logical_id, 'ChildAssetModelId', hierarchy.get('ChildAssetModelId'), MODEL_TYPE)
+
+        own_properties = set(property_ids)
+        for model_property in properties.get('AssetModelProperties', []):
+            type_name = model_property.get('Type', {}).get('TypeName')
+            for variable in model_property.get('Type', {}).get(type_name, {}).get('Variables', []):
+                value = variable.get('Value', {})
+                hierarchy_id = value.get('HierarchyLogicalId')
+                if hierarchy_id is None:
+                    if value.get('PropertyLogicalId') not in own_properties:
+                        self.add(ERROR, logical_id, f'Variable {variable.get("Name")} of {model_property.get("Name")} '
+                                                    f'references missing property {value.get("PropertyLogicalId")}')
+                elif hierarchy_id not in hierarchies:
+                    self.add(ERROR, logical_id, f'Variable {variable.get("Name")} of {model_property.get("Name")} '
+                                                f'references missing hierarchy {hierarchy_id}')
+                elif hierarchies[hierarchy_id] in self.models and \
+                        value.get('PropertyLogicalId') not in self.models[hierarchies[hierarchy_id]][0]:
+                    self.add(ERROR, logical_id, f'Variable {variable.get("Name")} of {model_property.get("Name")} '
+                                                f'references property {value.get("PropertyLogicalId")} missing from '
+                                                f'{hierarchies[hierarchy_id]}')
+
+    def check_asset(self, logical_id: str, properties: dict):
+        self.expect_type(logical_id, 'AssetModelId', properties.get('AssetModelId'), MODEL_TYPE)
+        model = self.models.get(ref_of(properties.get('AssetModelId')))
+        if model is None:
+            return
+
+        model_properties = set(model[0])
+        for asset_property in properties.get('AssetProperties', []):
+            if asset_property.get('LogicalId') not in model_properties:
+                self.add(ERROR, logical_id, f'Property LogicalId {asset_property.get("LogicalId")} is not a property '
+                                            f'of its model')
+        for hierarchy in properties.get('AssetHierarchies', []):
+            self.expect_type(logical_id, 'ChildAssetId', hierarchy.get('ChildAssetId'), ASSET_TYPE)
+            if hierarchy.get('LogicalId') not in model[1]:
+                self.add(ERROR, logical_id, f'Hierarchy LogicalId {hierarchy.get("LogicalId")} is not a hierarchy of '
+                                            f'its model')
+
+    def check_dashboard(self, logical_id: str, properties: dict):
+        for field in ('DashboardName', 'DashboardDefinition', 'DashboardDescription', 'ProjectId'):
+            if field not in properties:
+                self.add(ERROR, logical_id, f'{field} is missing')
+        try:
+            definition = json.loads(properties.get('DashboardDefinition', '{}'))
+            if not isinstance(definition.get('widgets', []), list):
+                self.add(ERROR, logical_id, 'DashboardDefinition widgets is not a list')
+        except (TypeError, ValueError, AttributeError) as e:
+            self.add(ERROR, logical_id, f'DashboardDefinition is not a JSON object: {e}')
+
+    def check_asset_parents(self):
+        """
+        An asset has a single parent, a ChildAssetId referenced twice is usually two assets whose names collided once
+        converted to a logical id
+        """
+        parents = {}
+        for logical_id, resource in self.resources.items():
+            if resource.get('Type') != ASSET_TYPE:
+                continue
+            for hierarchy in resource.get('Properties', {}).get('AssetHierarchies', []):
+                child = ref_of(hierarchy.get('ChildAssetId'))
+                if child in parents:
+                    self.add(ERROR, child, f'Child asset of both {parents[child]} and {logical_id}, asset names '
+                                           f'probably collided')
+                parents.setdefault(child, logical_id)
+
+    def check_model_cycles(self):
+        """
+        Detects circular ChildAssetModelId references, which CloudFormation rejects before creating anything
+        """
+        state = {}
+        for root in self.models:
+            if root in state:
+                continue
+            stack = [(root, iter(self.models[root][1].values()))]
+            state[root] = 'visiting'
+            while stack:
+                node, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    state[node] = 'done'
+                    stack.pop()
+                elif child in self.models and state.get(child) == 'visiting':
+                    self.add(ERROR, node, f'Circular model hierarchy through {child}')
+                elif child in self.models and child not in state:
+                    state[child] = 'visiting'
+                    stack.append((child, iter(self.models[child][1].values())))
+
+
+def validate_file(path: str) -> list:
+    """
+    Parses and validates a template file
+    :return: list of (level, logical id, message) findings
+    """
+    duplicate_keys = DuplicateKeys()
+    with open(path, 'rb') as fp:
+        body = fp.read()
+    try:
+        template = json.loads(body, object_pairs_hook=duplicate_keys)
+    except ValueError as e:
+        return [(ERROR, None, f'Not a JSON template: {e}')]
+    return TemplateValidator(template, len(body), duplicate_keys.paths(template)).validate()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s: %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p',
+                        stream=sys.stdout)
+
+    parser = argparse.ArgumentParser(description='Offline CloudFormation Template Validator For SiteWise')
+    parser.add_argument('templates', metavar='TEMPLATE', nargs='+',
+                        help='Templates to validate, i.e. cfnexport/*.json')
+    parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.debug(f'{__file__} called with arguments: {args}')
+
+    errors = 0
+    for template_path in args.templates:
+        start = time.time()
+        findings = validate_file(template_path)
+        for level, logical_id, message in findings:
+            logger.log(logging.ERROR if level == ERROR else logging.WARNING,
+                       f'{os.path.basename(template_path)}: {logical_id + ": " if logical_id else ""}{message}')
+        errors += sum(1 for finding in findings if finding[0] == ERROR)
+        logger.info(f'{template_path} validated in {time.time() - start:.2f}s: '
+                    f'{sum(1 for finding in findings if finding[0] == ERROR)} errors, '
+                    f'{sum(1 for finding in findings if finding[0] == WARNING)} warnings')
+    sys.exit(1 if errors else 0)
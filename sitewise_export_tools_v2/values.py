@@ -0,0 +1,268 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from inventory import TABLE_WRITERS, FORMATS
+from utils import create_client, assert_sitewise_response
+
+logger = logging.getLogger()
+
+# columns of the property value snapshot, the value is written as a string and converted back with value_type
+SNAPSHOT_COLUMNS = ['asset_id', 'asset_logical_id', 'property_id', 'property_name', 'alias', 'property_type',
+                    'value_type', 'value', 'time_in_seconds', 'offset_in_nanos', 'quality']
+
+# columns of the rejected values file of a replay, the snapshot row with the errors returned by SiteWise
+REJECTED_COLUMNS = SNAPSHOT_COLUMNS + ['error']
+
+# maximum number of entries of a batch_put_asset_property_value request
+BATCH_PUT_VALUE_ENTRIES = 10
+
+# computed properties get their values from SiteWise, they are never replayed
+COMPUTED_PROPERTY_TYPES = ('transform', 'metric')
+
+VALUE_TYPES = {
+    'stringValue': str,
+    'integerValue': int,
+    'doubleValue': float,
+    'booleanValue': lambda value: value == 'True'
+}
+
+
+def value_row(asset: dict, asset_property: dict, property_value: dict, property_type: str = None,
+              asset_logical_id: str = None) -> dict:
+    """
+    Maps a SiteWise asset property value to a snapshot row
+    :param asset: asset definition, as returned by discover_assets
+    :param asset_property: asset property the value belongs to
+    :param property_value: property value, with its value, timestamp and quality
+    :param asset_logical_id: logical id of the asset in the exported template
+    """
+    value_type, value = next(iter(property_value['value'].items()))
+    return {
+        'asset_id': asset['assetId'],
+        'asset_logical_id': asset_logical_id,
+        'property_id': asset_property['id'],
+        'property_name': asset_property['name'],
+        'alias': asset_property.get('alias'),
+        'property_type': property_type,
+        'value_type': value_type,
+        'value': str(value),
+        'time_in_seconds': str(property_value['timestamp']['timeInSeconds']),
+        'offset_in_nanos': str(property_value['timestamp'].get('offsetInNanos', 0)),
+        'quality': property_value.get('quality')
+    }
+
+
+def snapshot_writer(path: str, snapshot_format: str = 'ndjson', columns: list = None):
+    """
+    Creates the table writer of a property value snapshot
+    :param path: snapshot file, the extension of the format is added when missing
+    :param snapshot_format: one of inventory.FORMATS
+    :param columns: columns of the table, SNAPSHOT_COLUMNS by default
+    """
+    base_path, extension = os.path.splitext(path)
+    if extension != f'.{snapshot_format}':
+        base_path = path
+    if os.path.dirname(base_path) and not os.path.exists(os.path.dirname(base_path)):
+        os.makedirs(os.path.dirname(base_path))
+    return TABLE_WRITERS[snapshot_format](base_path, columns or SNAPSHOT_COLUMNS)
+
+
+def read_snapshot(path: str):
+    """
+    Generator over the rows of a property value snapshot, the format is told by the file extension
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    elif path.endswith('.csv'):
+        with open(path, newline='') as fp:
+            for row in csv.DictReader(fp):
+                yield {k: v if v != '' else None for k, v in row.items()}
+    else:
+        with open(path) as fp:
+            for line in fp:
+                yield json.loads(line)
+
+
+class ValueReplayer:
+    """
+    Replays the values of a snapshot with batch_put_asset_property_value. When the assets were imported into another
+    account, their new ids come from the id map saved by importer.py and their properties are matched by name. Values
+    are stamped with the time they are replayed at, as SiteWise rejects values older than 7 days, unless the original
+    timestamps are kept. The rows SiteWise rejects are written to the rejected writer, with its errors.
+    """
+
+    def __init__(self, client, id_map: dict = None, max_workers: int = 10, keep_timestamps: bool = False,
+                 rejected=None):
+        """
+        :param client: Boto3 IoTSiteWise client
+        :param id_map: logical id to SiteWise id mapping saved by importer.py, None to replay to the same assets
+        :param max_workers: maximum number of concurrent requests
+        :param keep_timestamps: replay the values with their original timestamps instead of the current time
+        :param rejected: table writer of the rejected rows, with REJECTED_COLUMNS, None to only log them
+        """
+        self.client = client
+        self.id_map = id_map
+        self.max_workers = max_workers
+        self.keep_timestamps = keep_timestamps
+        self.rejected = rejected
+        # property_ids: asset id to (property name to property id) mapping of the destination assets, an asset may be
+        # described twice by concurrent requests but the mapping is the same
+        self.property_ids = {}
+        self.lock = threading.Lock()
+        self.counts = {'replayed': 0, 'skipped': 0, 'failed': 0}
+
+    def destination(self, row: dict) -> tuple:
+        """
+        :return: destination asset and property ids of a snapshot row
+        """
+        if self.id_map is None:
+            return row['asset_id'], row['property_id']
+
+        asset_id = self.id_map[row['asset_logical_id']]
+        if asset_id not in self.property_ids:
+            asset = self.client.describe_asset(assetId=asset_id)
+            assert_sitewise_response(asset, 'describe_asset')
+            self.property_ids[asset_id] = {p['name']: p['id'] for p in asset['assetProperties']}
+        return asset_id, self.property_ids[asset_id][row['property_name']]
+
+    def timestamp(self, row: dict) -> dict:
+        """
+        :return: SiteWise timestamp of a replayed value, the current time unless the original timestamps are kept
+        """
+        if self.keep_timestamps:
+            return {'timeInSeconds': int(row['time_in_seconds']), 'offsetInNanos': int(row['offset_in_nanos'] or 0)}
+        now = time.time_ns()
+        return {'timeInSeconds': now // 10 ** 9, 'offsetInNanos': now % 10 ** 9}
+
+    def reject(self, row: dict, message: str):
+        """
+        Logs a row that was not replayed and writes it to the rejected writer, the caller holds the lock
+        """
+        logger.warning(f'Failed to replay the value of {row["asset_logical_id"] or row["asset_id"]}/'
+                       f'{row["property_name"]}: {message}')
+        if self.rejected:
+            self.rejected.write({**{column: row.get(column) for column in SNAPSHOT_COLUMNS}, 'error': message})
+        self.counts['failed'] += 1
+
+    def put_values(self, rows: list):
+        entries = []
+        unmapped = []
+        for idx, row in enumerate(rows):
+            try:
+                asset_id, property_id = self.destination(row)
+            except KeyError:
+                unmapped.append(row)
+                continue
+            entries.append({
+                'entryId': str(idx),
+                'assetId': asset_id,
+                'propertyId': property_id,
+                'propertyValues': [{
+                    'value': {row['value_type']: VALUE_TYPES[row['value_type']](row['value'])},
+                    'timestamp': self.timestamp(row),
+                    'quality': row['quality'] or 'GOOD'
+                }]
+            })
+
+        error_entries = []
+        if entries:
+            resp = self.client.batch_put_asset_property_value(entries=entries)
+            assert_sitewise_response({'ResponseMetadata': resp['ResponseMetadata']}, 'batch_put_asset_property_value')
+            error_entries = resp.get('errorEntries', [])
+        with self.lock:
+            for row in unmapped:
+                self.reject(row, 'unmapped asset/property: the asset is not in the id map or has no property of '
+                                 'this name')
+            for error in error_entries:
+                self.reject(rows[int(error['entryId'])],
+                            '; '.join(f'{e["errorCode"]}: {e["errorMessage"]}' for e in error['errors']))
+            self.counts['replayed'] += len(entries) - len(error_entries)
+
+    def replay(self, rows) -> dict:
+        """
+        Replays the rows of a snapshot, BATCH_PUT_VALUE_ENTRIES per request. Rows are read as they are sent, at most
+        max_workers * 2 requests are pending at any time.
+        :param rows: snapshot rows, i.e. from read_snapshot
+        :return: number of replayed, skipped and failed (rejected by SiteWise) values
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            batch = []
+            for row in rows:
+                if row['property_type'] in COMPUTED_PROPERTY_TYPES or row['value'] is None:
+                    self.counts['skipped'] += 1
+                    continue
+                batch.append(row)
+                if len(batch) == BATCH_PUT_VALUE_ENTRIES:
+                    pending.append(executor.submit(self.put_values, batch))
+                    batch = []
+                if len(pending) >= self.max_workers * 2:
+                    pending.popleft().result()
+            if batch:
+                pending.append(executor.submit(self.put_values, batch))
+            while pending:
+                pending.popleft().result()
+        return self.counts
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s: %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p',
+                        stream=sys.stdout)
+
+    logging.getLogger('boto3').setLevel(logging.CRITICAL)
+    logging.getLogger('botocore').setLevel(logging.CRITICAL)
+    logging.getLogger('s3transfer').setLevel(logging.CRITICAL)
+    logging.getLogger('urllib3').setLevel(logging.CRITICAL)
+
+    parser = argparse.ArgumentParser(description='Property Value Replay Tool For SiteWise')
+    parser.add_argument('snapshot', help=f'Property value snapshot saved by main.py --values, '
+                                         f'its extension tells the format ({", ".join(FORMATS)})')
+    parser.add_argument('--profile', help='Credentials profile for the AWS account')
+    parser.add_argument('--region', help='Specify the AWS region you would like to target')
+    parser.add_argument('--id-map', metavar='FILE',
+                        help='Ids of the assets imported by importer.py, the values are replayed to the same assets '
+                             'when omitted')
+    parser.add_argument('--max-workers', type=int, default=10, help='Maximum number of concurrent SiteWise calls')
+    parser.add_argument('--keep-timestamps', action='store_true', default=False,
+                        help='Replay the values with their original timestamps instead of the current time, SiteWise '
+                             'rejects values older than 7 days')
+    parser.add_argument('--rejected', metavar='FILE',
+                        help='Also write the values rejected by SiteWise to this file, with their errors, in the format '
+                             'of the snapshot')
+    parser.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logger.debug(f'{__file__} called with arguments: {args}')
+
+    id_map = None
+    if args.id_map:
+        with open(args.id_map) as fp:
+            id_map = json.load(fp)
+
+    snapshot_format = next((f for f in FORMATS if args.snapshot.endswith(f'.{f}')), 'ndjson')
+    rejected = snapshot_writer(args.rejected, snapshot_format, REJECTED_COLUMNS) if args.rejected else None
+    client = create_client(args.profile, args.region, max(args.max_workers, 10))
+    try:
+        counts = ValueReplayer(client, id_map, args.max_workers, args.keep_timestamps,
+                               rejected).replay(read_snapshot(args.snapshot))
+    finally:
+        if rejected:
+            rejected.close()
+    logger.info(f'{counts["replayed"]} values replayed, {counts["skipped"]} computed or empty values skipped and '
+                f'{counts["failed"]} rejected' + (f', see {args.rejected}' if args.rejected and counts['failed'] else ''))
+    sys.exit(1 if counts['failed'] else 0)
@@ -4,23 +4,44 @@
 import boto3
 import os
 import json
+import re
+import shutil
+import threading
+import time
+import uuid
 
-from os import listdir
-from os.path import isfile, join
+from concurrent.futures import Future, ThreadPoolExecutor
+from os.path import join
 
 import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# New assets name:id map
-asset_dictionary = {}
+# Default number of concurrent API calls
+MAX_WORKERS = 10
 
-# New Properties name:id map
-property_dictionary = {}
+# Default seconds a saved destination index is used for, the destination account is crawled again once it is older
+INDEX_MAX_AGE = 86400
 
-# Maps of old and new id
-asset_id_mapping = {}
-property_id_mapping = {}
+# CloudFormation per-template limits, templates are split in shards below them
+MAX_TEMPLATE_RESOURCES = 500
+MAX_TEMPLATE_BYTES = 1000000
+
+# Dashboards or destination assets processed between two checks of the remaining time of a chunked invocation
+CHUNK_SIZE = 100
+
+# Default milliseconds left to a chunked invocation when it saves its state and stops, enough to process a chunk
+TIME_MARGIN_MS = 60000
+
+# Default folder the progress of chunked migrations is saved to, on AWS Lambda mount an EFS file system there so it is
+# kept between invocations
+STATE_PATH = '/tmp/migration_state'
+
+# Continuation tokens name the state files of chunked migrations, they are uuid4 hex strings
+CONTINUATION_TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Names of the template shards written after the first one, dashboards_cfn_<shard number>.json
+SHARD_FILE_PATTERN = re.compile(r'^dashboards_cfn_([0-9]+)\.json$')
 
 cfn_base = {
     'AWSTemplateFormatVersion': '2010-09-09',
@@ -28,98 +49,395 @@ cfn_base = {
     'Resources': {}
 }
 
+#############################################################################
+# Memo class memoizes a function for the duration of one migration: calls  #
+# with the same arguments, concurrent ones included, share the result of   #
+# the first call. Memos are created by each migration, a warm Lambda       #
+# container never serves the names looked up by a previous migration       #
+#############################################################################
+
+
+class Memo:
+    def __init__(self, function):
+        self.function = function
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            future = self.futures.get(args)
+            owner = future is None
+            if owner:
+                future = self.futures[args] = Future()
+        if owner:
+            try:
+                future.set_result(self.function(*args))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def results(self):
+        return [[*args, future.result()] for args, future in list(self.futures.items())
+                if future.done() and future.exception() is None]
+
+    def preload(self, results):
+        for *args, result in results:
+            future = Future()
+            future.set_result(result)
+            self.futures[tuple(args)] = future
+
+
 #############################################################################
 # backup_dashboards function discover all projects and dashboards under     #
-# portal_name in the source account                                         #
+# portal_name in the source account, describes them and resolves the unique #
+# asset/property pairs they use concurrently. It returns one record per     #
+# dashboard, with its definition parsed once, that is carried in memory     #
+# through mapping and template generation                                   #
 #############################################################################
 
 
-def backup_dashboards(clt, portal_name):
-    portals = clt.list_portals()
-    for portal in portals['portalSummaries']:
-        if portal['name'] == portal_name:
-            projects = clt.list_projects(portalId=portal['id'])
-            for project in projects['projectSummaries']:
-                dashboards = clt.list_dashboards(projectId=project['id'])
-                for dashboard in dashboards['dashboardSummaries']:
-                    save_dashboard_description(clt, dashboard['id'])
+def backup_dashboards(clt, portal_name, max_workers=MAX_WORKERS, spill_path=None):
+    return backup_dashboard_batch(clt, list_dashboard_ids(clt, portal_name), new_source_resolvers(clt),
+                                  max_workers, spill_path)
+
+
+def list_dashboard_ids(clt, portal_name):
+    dashboard_ids = []
+    for portal_page in clt.get_paginator('list_portals').paginate():
+        for portal in portal_page['portalSummaries']:
+            if portal['name'] == portal_name:
+                for project_page in clt.get_paginator('list_projects').paginate(portalId=portal['id']):
+                    for project in project_page['projectSummaries']:
+                        for dashboard_page in clt.get_paginator('list_dashboards').paginate(projectId=project['id']):
+                            for dashboard in dashboard_page['dashboardSummaries']:
+                                dashboard_ids.append(dashboard['id'])
+    return dashboard_ids
 
 
 #############################################################################
-# save_dashboard_description function creates temporal json files to keep   #
-# dashboards basic information needed to re-create them and a metadata file #
-# to map objects IDs with names, hash table is used latter to replace       #
-# source account IDs with destination account IDs base in objects names     #
+# backup_dashboard_batch function backs up the given dashboards, chunked    #
+# invocations back up a portal one batch of dashboards at a time            #
 #############################################################################
 
 
-def save_dashboard_description(clt, dashboard_id):
-    dashboard = clt.describe_dashboard(dashboardId=dashboard_id)
+def backup_dashboard_batch(clt, dashboard_ids, resolvers, max_workers=MAX_WORKERS, spill_path=None):
+    resolve_asset_property = resolvers['asset_property']
+    resolve_asset_path = resolvers['asset_path']
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dashboards = list(executor.map(lambda dashboard_id: clt.describe_dashboard(dashboardId=dashboard_id),
+                                       dashboard_ids))
+        definitions = [json.loads(dashboard.pop('dashboardDefinition')) for dashboard in dashboards]
+
+        # each asset/property pair is described only once, no matter how many dashboards use it
+        metrics = {(metric['assetId'], metric['propertyId'])
+                   for definition in definitions
+                   for widget in definition['widgets']
+                   for metric in widget['metrics']}
+        list(executor.map(lambda metric: resolve_asset_property(*metric), metrics))
+
+        # capture the hierarchy path of each asset so it can be matched even when names are not unique
+        list(executor.map(lambda metric: resolve_asset_path(metric[0], resolve_asset_property(*metric)[0]),
+                          metrics))
+
+    return [save_dashboard_description(resolvers, dashboard, definition, spill_path)
+            for dashboard, definition in zip(dashboards, definitions)]
+
+
+#############################################################################
+# new_source_resolvers function creates the look-ups of one migration of   #
+# the source assets used by the dashboards:                                #
+# - asset_property: (asset id, property id):(asset name, property name)    #
+# - asset_path: (asset id, asset name):hierarchy path                      #
+#############################################################################
+
+
+def new_source_resolvers(clt):
+    return {
+        'asset_property': asset_property_resolver(clt),
+        'asset_path': asset_path_resolver(clt)
+    }
+
+
+#############################################################################
+# asset_property_resolver function returns the function resolving the      #
+# asset and property names of a source asset property for one migration,   #
+# each pair is described only once                                          #
+#############################################################################
+
+
+def asset_property_resolver(clt):
+    def describe_asset_property(asset_id, property_id):
+        item = clt.describe_asset_property(assetId=asset_id, propertyId=property_id)
+        return item['assetName'], item['assetProperty']['name']
+    return Memo(describe_asset_property)
+
+
+#############################################################################
+# asset_path_resolver function returns the function resolving the          #
+# hierarchy path of an asset, i.e. Site/Line/Machine, for one migration.   #
+# It walks up the parents of the asset, shared ancestors are only looked   #
+# up once, even by concurrent calls                                         #
+#############################################################################
+
+
+def asset_path_resolver(clt):
+    def walk_asset_path(asset_id, asset_name):
+        parents = clt.list_associated_assets(assetId=asset_id, traversalDirection='PARENT')['assetSummaries']
+        if parents:
+            return resolve_asset_path(parents[0]['id'], parents[0]['name']) + '/' + asset_name
+        return asset_name
+    resolve_asset_path = Memo(walk_asset_path)
+    return resolve_asset_path
+
+
+#############################################################################
+# save_dashboard_description function keeps the dashboards basic           #
+# information needed to re-create them and a metadata map of objects IDs to #
+# names, used latter to replace source account IDs with destination account #
+# IDs base in objects names. When spill_path is set the record is also      #
+# written to disk as <spill_path>/<dashboard id>.json                       #
+#############################################################################
+
+
+def save_dashboard_description(resolvers, dashboard, definition, spill_path=None):
     metadata = {}
-    for widget in json.loads(dashboard['dashboardDefinition'])['widgets']:
+    paths = {}
+    for widget in definition['widgets']:
         for metric in widget['metrics']:
-            item = clt.describe_asset_property(assetId=metric['assetId'], propertyId=metric['propertyId'])
-            metadata[item['assetId']] = item['assetName']
-            metadata[item['assetProperty']['id']] = item['assetProperty']['name']
+            asset_name, property_name = resolvers['asset_property'](metric['assetId'], metric['propertyId'])
+            metadata[metric['assetId']] = asset_name
+            metadata[metric['propertyId']] = property_name
+            paths[metric['assetId']] = resolvers['asset_path'](metric['assetId'], asset_name)
 
-    if not os.path.exists('dashboards'):
-        os.makedirs('dashboards')
+    dashboard.pop('ResponseMetadata', None)
     dashboard.pop('dashboardCreationDate')
     dashboard.pop('dashboardLastUpdateDate')
-    dash = json.dumps(dashboard)
-    f = open("dashboards/{}.json".format(dashboard['dashboardName']), "w")
-    f.write(dash)
-    f.close()
+    record = {'dashboard': dashboard, 'definition': definition, 'metadata': metadata, 'paths': paths}
+
+    if spill_path:
+        if not os.path.exists(spill_path):
+            os.makedirs(spill_path)
+        with open(join(spill_path, '{}.json'.format(dashboard['dashboardId'])), 'w') as f:
+            f.write(json.dumps(record))
+
+    return record
+
+
+#############################################################################
+# new_destination_index function creates the look-up maps of one            #
+# destination account/region:                                               #
+# - asset_dictionary: new assets name:id map                                #
+# - property_dictionary: new Properties name:id map                         #
+# - asset_path_dictionary: new assets hierarchy path:id map, i.e.           #
+#   Site/Line/Machine                                                       #
+# - property_path_dictionary: new Properties hierarchy path:id map          #
+# - ambiguous_asset_names: new assets names used by more than one asset     #
+# - indexed_asset_ids: ids of the new assets already in the maps           #
+# - asset_id_mapping, property_id_mapping: maps of old and new id           #
+#############################################################################
+
+
+def new_destination_index():
+    return {
+        'asset_dictionary': {},
+        'property_dictionary': {},
+        'asset_path_dictionary': {},
+        'property_path_dictionary': {},
+        'ambiguous_asset_names': set(),
+        'indexed_asset_ids': set(),
+        'asset_id_mapping': {},
+        'property_id_mapping': {}
+    }
+
+
+#############################################################################
+# generate_asset_property_dictionary function generate the maps to look-up, #
+# between Names or hierarchy paths and IDs in the destination account. The  #
+# assets are crawled top-down from the assets of model_id: each level is    #
+# described concurrently and the path of each child is its parent path      #
+# followed by its name, so paths cost no extra calls. The assets of the     #
+# child models not reached by the crawl, i.e. top-level or associated to    #
+# assets of other models, are then crawled from their own hierarchy path    #
+#############################################################################
+
+
+def generate_asset_property_dictionary(clt, model_id, max_workers=MAX_WORKERS):
+    index = new_destination_index()
+    for model_ids in ([model_id], list_child_models(clt, model_id)):
+        assets = list_destination_model_assets(clt, index, model_ids, max_workers)
+        while assets:
+            assets = index_destination_assets(clt, index, assets, max_workers)
+    return index
+
+
+#############################################################################
+# list_child_models function returns the ids of the models below model_id,  #
+# at any depth of its hierarchies                                           #
+#############################################################################
+
+
+def list_child_models(clt, model_id):
+    child_model_ids = []
+    pending = [model_id]
+    while pending:
+        model = clt.describe_asset_model(assetModelId=pending.pop(0))
+        for hierarchy in model['assetModelHierarchies']:
+            if hierarchy['childAssetModelId'] != model_id and hierarchy['childAssetModelId'] not in child_model_ids:
+                child_model_ids.append(hierarchy['childAssetModelId'])
+                pending.append(hierarchy['childAssetModelId'])
+    return child_model_ids
+
+
+#############################################################################
+# list_destination_model_assets function returns the assets of model_ids    #
+# that are not indexed yet, with their hierarchy paths from the top-level   #
+# asset of the account, to crawl from                                       #
+#############################################################################
+
 
-    if not os.path.exists('metadata'):
-        os.makedirs('metadata')
-    dash_meta = json.dumps(metadata)
-    f = open("metadata/{}.json".format(dashboard['dashboardName']), "w")
-    f.write(dash_meta)
-    f.close()
+def list_destination_model_assets(clt, index, model_ids, max_workers=MAX_WORKERS):
+    assets = []
+    for model_id in model_ids:
+        for page in clt.get_paginator('list_assets').paginate(assetModelId=model_id, filter='ALL'):
+            assets.extend(asset for asset in page['assetSummaries']
+                          if asset['id'] not in index['indexed_asset_ids'])
+
+    resolve_asset_path = asset_path_resolver(clt)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = list(executor.map(lambda asset: resolve_asset_path(asset['id'], asset['name']), assets))
+    return [{'id': asset['id'], 'name': asset['name'], 'path': path} for asset, path in zip(assets, paths)]
 
 
 #############################################################################
-# generate_asset_property_dictionary function generate 2 maps to look-up,   #
-# between Names and IDs in the destination account                          #
+# index_destination_assets function describes the given destination assets #
+# concurrently, adds them to the look-up maps and returns their children,   #
+# the next assets to index, but the ones already indexed. Chunked          #
+# invocations index them one batch at a time                                #
 #############################################################################
 
 
-def generate_asset_property_dictionary(clt, model_id):
-    model = clt.describe_asset_model(assetModelId=model_id)
+def index_destination_assets(clt, index, assets, max_workers=MAX_WORKERS):
+    def crawl_asset(asset):
+        description = clt.describe_asset(assetId=asset['id'])
+        children = []
+        for hierarchy in description['assetHierarchies']:
+            for page in clt.get_paginator('list_associated_assets').paginate(assetId=asset['id'],
+                                                                             hierarchyId=hierarchy['id'],
+                                                                             traversalDirection='CHILD'):
+                children.extend({'id': child['id'], 'name': child['name'], 'path': asset['path'] + '/' + child['name']}
+                                for child in page['assetSummaries'])
+        return description, children
+
+    children = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for asset, (description, asset_children) in zip(assets, executor.map(crawl_asset, assets)):
+            if index['asset_dictionary'].get(asset['name'], asset['id']) != asset['id']:
+                index['ambiguous_asset_names'].add(asset['name'])
+            index['asset_dictionary'][asset['name']] = asset['id']
+            index['asset_path_dictionary'][asset['path']] = asset['id']
+            index['indexed_asset_ids'].add(asset['id'])
+            for asset_property in description['assetProperties']:
+                index['property_dictionary'][asset['name']+'+'+asset_property['name']] = asset_property['id']
+                index['property_path_dictionary'][asset['path']+'+'+asset_property['name']] = asset_property['id']
+            children.extend(asset_children)
+    return [child for child in children if child['id'] not in index['indexed_asset_ids']]
+
+
+#############################################################################
+# save_destination_index and load_destination_index functions persist the   #
+# destination look-up maps so they can be reused between migrations. The    #
+# index is saved with the key of its destination (account, region and root  #
+# model) and is only loaded for the same key, and while younger than        #
+# max_age seconds                                                           #
+#############################################################################
 
-    if len(model['assetModelHierarchies']) > 0:
-        for child in model['assetModelHierarchies']:
-            generate_asset_property_dictionary(clt, child['childAssetModelId'])
-    assets = clt.list_assets(assetModelId=model_id, filter='ALL')['assetSummaries']
-    for asset in assets:
-        asset_dictionary[asset['name']] = asset['id']
-        properties = clt.describe_asset(assetId=asset['id'])['assetProperties']
-        for asset_property in properties:
-            property_dictionary[asset['name']+'+'+asset_property['name']] = asset_property['id']
+
+def destination_index_key(destination):
+    identity = create_destination_client(destination, 'sts').get_caller_identity()
+    return {
+        'account': identity['Account'],
+        'region': destination['DESTINATION_REGION_NAME'],
+        'root_model_id': destination['DESTINATION_ROOT_MODEL_ID']
+    }
+
+
+def save_destination_index(index, index_path, key=None):
+    saved_index = {
+        'key': key,
+        'saved': time.time(),
+        'asset_dictionary': index['asset_dictionary'],
+        'property_dictionary': index['property_dictionary'],
+        'asset_path_dictionary': index['asset_path_dictionary'],
+        'property_path_dictionary': index['property_path_dictionary'],
+        'ambiguous_asset_names': sorted(index['ambiguous_asset_names']),
+        'indexed_asset_ids': sorted(index['indexed_asset_ids'])
+    }
+    with open(index_path, 'w') as f:
+        f.write(json.dumps(saved_index))
+
+
+def load_destination_index(index_path, key=None, max_age=None):
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        saved_index = json.load(f)
+    if key is not None and saved_index.get('key') != key:
+        logger.info(f'Destination index {index_path} is not of {key}, indexing the destination again')
+        return None
+    if max_age is not None and time.time() - saved_index.get('saved', 0) > max_age:
+        logger.info(f'Destination index {index_path} is older than {max_age}s, indexing the destination again')
+        return None
+
+    index = new_destination_index()
+    index['asset_dictionary'].update(saved_index['asset_dictionary'])
+    index['property_dictionary'].update(saved_index['property_dictionary'])
+    index['asset_path_dictionary'].update(saved_index['asset_path_dictionary'])
+    index['property_path_dictionary'].update(saved_index['property_path_dictionary'])
+    index['ambiguous_asset_names'].update(saved_index['ambiguous_asset_names'])
+    # indexes saved before the ids were recorded hold the ids of the asset paths
+    index['indexed_asset_ids'].update(saved_index.get('indexed_asset_ids',
+                                                      saved_index['asset_path_dictionary'].values()))
+    return index
 
 
 ###################################################################################
 # map_ids function generate 2 maps to look-up base in old assets and property ids #
-# the new ids in the new environment based in assets and property names.          #
+# the new ids in the new environment based in assets hierarchy paths and property #
+# names, falling back to assets names when the path is not found. It fails when   #
+# an asset or property is not found, or only by a name used by several assets,    #
+# rather than mapping a dashboard to the wrong asset                              #
 ###################################################################################
 
 
-def map_ids():
-    files = [f for f in listdir('dashboards') if isfile(join('dashboards', f))]
-
-    for file in files:
-        with open('dashboards/{}'.format(file)) as dashboard_file:
-            dashboard = json.load(dashboard_file)
-            with open('metadata/{}'.format(file)) as metadata_file:
-                dashboard_metadata = json.load(metadata_file)
-                for widget in json.loads(dashboard['dashboardDefinition'])['widgets']:
-                    for metric in widget['metrics']:
-                        asset_id_mapping[metric['assetId']] = asset_dictionary[dashboard_metadata[metric['assetId']]]
-                        property_id_mapping[metric['propertyId']] = \
-                            property_dictionary[dashboard_metadata[metric['assetId']]
-                                                + '+'
-                                                + dashboard_metadata[metric['propertyId']]]
+def map_ids(dashboards, index):
+    unresolved = set()
+    for record in dashboards:
+        dashboard_metadata = record['metadata']
+        for widget in record['definition']['widgets']:
+            for metric in widget['metrics']:
+                asset_path = record['paths'].get(metric['assetId'])
+                property_name = dashboard_metadata[metric['propertyId']]
+                if f'{asset_path}+{property_name}' in index['property_path_dictionary']:
+                    index['asset_id_mapping'][metric['assetId']] = index['asset_path_dictionary'][asset_path]
+                    index['property_id_mapping'][metric['propertyId']] = \
+                        index['property_path_dictionary'][f'{asset_path}+{property_name}']
+                    continue
+
+                asset_name = dashboard_metadata[metric['assetId']]
+                if asset_name in index['ambiguous_asset_names']:
+                    unresolved.add(f'"{asset_path}" not found and "{asset_name}" is the name of several assets')
+                    continue
+                if asset_name + '+' + property_name not in index['property_dictionary']:
+                    unresolved.add(f'"{asset_path}+{property_name}" not found')
+                    continue
+                index['asset_id_mapping'][metric['assetId']] = index['asset_dictionary'][asset_name]
+                index['property_id_mapping'][metric['propertyId']] = \
+                    index['property_dictionary'][asset_name
+                                                 + '+'
+                                                 + property_name]
+
+    if unresolved:
+        raise ValueError('Dashboard assets not found in the destination: ' + '; '.join(sorted(unresolved)))
 
 
 ###################################################################################
@@ -128,87 +446,379 @@ def map_ids():
 ###################################################################################
 
 
-def create_cfn(clt, portal_name, project_name):
-    portals = clt.list_portals()['portalSummaries']
-    for portal in portals:
-        if portal['name'] == portal_name:
-            projects = clt.list_projects(portalId=portal['id'])
-            for project in projects['projectSummaries']:
-                if project['name'] == project_name:
-                    create_file(project['id'])
+def create_cfn(clt, portal_name, project_name, dashboards, index, export_path='cfnexport'):
+    for portal_page in clt.get_paginator('list_portals').paginate():
+        for portal in portal_page['portalSummaries']:
+            if portal['name'] == portal_name:
+                for project_page in clt.get_paginator('list_projects').paginate(portalId=portal['id']):
+                    for project in project_page['projectSummaries']:
+                        if project['name'] == project_name:
+                            create_file(project['id'], dashboards, index, export_path)
 
 
 ###################################################################################
-# create_file function uses the temporal files created based in source account    #
-# dashboards information and, using the maps, replace sources IDs with            #
-# destination IDs before create the CFN template                                  #
+# create_file function uses the dashboards backed up from the source account and, #
+# using the maps, replace sources IDs with destination IDs before create the CFN  #
+# templates. The backed up definitions are left untouched.                        #
 ###################################################################################
 
 
-def create_file(project_id):
-    cfn = cfn_base.copy()
-    files = [f for f in listdir('dashboards') if isfile(join('dashboards', f))]
+def create_file(project_id, dashboards, index, export_path='cfnexport'):
+    resources = {}
+    asset_id_mapping = index['asset_id_mapping']
+    property_id_mapping = index['property_id_mapping']
+
+    for record in dashboards:
+        dashboard = record['dashboard']
+        dashboard_definition = {
+            **record['definition'],
+            'widgets': [
+                {**widget, 'metrics': [{**metric,
+                                        'assetId': asset_id_mapping[metric['assetId']],
+                                        'propertyId': property_id_mapping[metric['propertyId']]}
+                                       for metric in widget['metrics']]}
+                for widget in record['definition']['widgets']
+            ]
+        }
+
+        logical_id = f'Dashboard{dashboard["dashboardName"].replace(" ", "")}'
+        if logical_id in resources:
+            # dashboards sharing a name are kept apart by their source id
+            logical_id += dashboard['dashboardId'].replace('-', '')
+
+        new_dashboard = {
+            logical_id: {
+                "Type": "AWS::IoTSiteWise::Dashboard",
+                "Properties": {
+                    "DashboardDefinition": json.dumps(dashboard_definition),
+                    "DashboardDescription": dashboard['dashboardDescription'],
+                    "DashboardName": dashboard['dashboardName'],
+                    "ProjectId": project_id
+                }
+            }
+        }
 
-    for file in files:
-        with open('dashboards/{}'.format(file)) as dashboard_file:
-            dashboard = json.load(dashboard_file)
-            dashboard.pop('ResponseMetadata')
-            dashboard.pop('dashboardId')
-            dashboard.pop('dashboardArn')
+        resources.update(new_dashboard)
 
-            dashboard['projectId'] = project_id
-            dashboard_definition = json.loads(dashboard['dashboardDefinition'])
-            new_widgets = []
-            for widget in dashboard_definition['widgets']:
-                for i in range(len(widget['metrics'])):
-                    widget['metrics'][i]['assetId'] = asset_id_mapping[widget['metrics'][i]['assetId']]
-                    widget['metrics'][i]['propertyId'] = property_id_mapping[widget['metrics'][i]['propertyId']]
-                new_widgets.append(widget)
-            dashboard_definition['widgets'] = new_widgets
-            dashboard['dashboardDefinition'] = json.dumps(dashboard_definition)
+    write_templates(resources, export_path)
+
+
+###################################################################################
+# write_templates function splits the resources in shards that stay under the     #
+# CloudFormation per-template limits and writes them as dashboards_cfn.json,      #
+# dashboards_cfn_2.json, ... The shards of a previous run above the new count are  #
+# removed so they are never deployed with the new ones                            #
+###################################################################################
 
-            new_dashboard = {
-                f'Dashboard{dashboard["dashboardName"].replace(" ", "")}': {
-                    "Type": "AWS::IoTSiteWise::Dashboard",
-                    "Properties": {
-                        "DashboardDefinition": json.dumps(dashboard_definition),
-                        "DashboardDescription": dashboard['dashboardDescription'],
-                        "DashboardName": dashboard['dashboardName'],
-                        "ProjectId": dashboard['projectId']
-                    }
-                }
-            }
 
-            cfn['Resources'].update(new_dashboard)
+def write_templates(resources, export_path='cfnexport'):
+    base_size = len(json.dumps(cfn_base))
+    shards = [{}]
+    shard_size = base_size
+    for logical_id, resource in resources.items():
+        resource_size = len(json.dumps({logical_id: resource}))
+        if len(shards[-1]) >= MAX_TEMPLATE_RESOURCES or \
+                (shards[-1] and shard_size + resource_size > MAX_TEMPLATE_BYTES):
+            shards.append({})
+            shard_size = base_size
+        shards[-1][logical_id] = resource
+        shard_size += resource_size
 
-    if not os.path.exists('cfnexport'):
-        os.makedirs('cfnexport')
+    if not os.path.exists(export_path):
+        os.makedirs(export_path)
 
-    f = open("cfnexport/dashboards_cfn.json".format(dashboard['dashboardName']), "w")
-    f.write(json.dumps(cfn))
-    f.close()
+    for shard_number, shard in enumerate(shards, start=1):
+        file_name = 'dashboards_cfn.json' if shard_number == 1 else 'dashboards_cfn_{}.json'.format(shard_number)
+        f = open(join(export_path, file_name), "w")
+        f.write(json.dumps({**cfn_base, 'Resources': shard}))
+        f.close()
+
+    for file_name in os.listdir(export_path):
+        shard_file = SHARD_FILE_PATTERN.match(file_name)
+        if shard_file and int(shard_file.group(1)) > len(shards):
+            os.remove(join(export_path, file_name))
+
+
+###################################################################################
+# migrate_destination function indexes one destination account/region, maps the  #
+# backed up dashboards to it and writes its CFN templates                         #
+###################################################################################
+
+
+def migrate_destination(destination, dashboards, max_workers=MAX_WORKERS, export_path='cfnexport'):
+    destination_client = create_destination_client(destination)
+
+    index_path = destination.get('DESTINATION_INDEX_PATH')
+    index = None
+    if index_path:
+        index_key = destination_index_key(destination)
+        index = load_destination_index(index_path, index_key,
+                                       int(destination.get('DESTINATION_INDEX_MAX_AGE', INDEX_MAX_AGE)))
+    if index is None:
+        index = generate_asset_property_dictionary(destination_client, destination['DESTINATION_ROOT_MODEL_ID'],
+                                                   max_workers)
+        if index_path:
+            save_destination_index(index, index_path, index_key)
+    map_ids(dashboards, index)
+    create_cfn(destination_client, destination['DESTINATION_PORTAL_NAME'], destination['DESTINATION_PROJECT_NAME'],
+               dashboards, index, export_path)
+
+
+def create_destination_client(destination, service_name='iotsitewise'):
+    return boto3.client(service_name,
+                        aws_access_key_id=destination['DESTINATION_AWS_SERVER_PUBLIC_KEY'],
+                        aws_secret_access_key=destination['DESTINATION_AWS_SERVER_SECRET_KEY'],
+                        region_name=destination['DESTINATION_REGION_NAME'])
+
+
+###################################################################################
+# get_destinations function returns the (destination, export path) pairs of the   #
+# parameters, the parameters are the only destination when DESTINATIONS is unset  #
+###################################################################################
+
+
+def get_destinations(parameters):
+    destinations = parameters.get('DESTINATIONS')
+    if not destinations:
+        return [(parameters, 'cfnexport')]
+
+    if isinstance(destinations, str):
+        destinations = json.loads(destinations)
+    export_paths = [join('cfnexport', destination.get('DESTINATION_NAME', destination['DESTINATION_REGION_NAME']))
+                    for destination in destinations]
+    if len(set(export_paths)) != len(export_paths):
+        raise ValueError('DESTINATION_NAME is required to tell apart destinations sharing a region')
+    return list(zip(destinations, export_paths))
+
+
+###################################################################################
+# save_state and load_state functions persist the progress of a chunked migration #
+# in <STATE_PATH>/<continuation token>.json, with the source look-ups resolved so #
+# far so a follow-up invocation does not describe them again                      #
+###################################################################################
+
+
+def save_state(state, state_file, resolvers):
+    state['resolvers'] = {name: resolver.results() for name, resolver in resolvers.items()}
+    with open(state_file + '.tmp', 'w') as f:
+        f.write(json.dumps(state))
+    os.replace(state_file + '.tmp', state_file)
+
+
+def load_state(state_file, resolvers):
+    with open(state_file) as f:
+        state = json.load(f)
+    for name, resolver in resolvers.items():
+        resolver.preload(state['resolvers'][name])
+    return state
+
+
+###################################################################################
+# prepare_state_path function creates the state folder of chunked migrations and #
+# fails before any work is done when it is not writable                           #
+###################################################################################
+
+
+def prepare_state_path(state_path):
+    try:
+        os.makedirs(state_path, exist_ok=True)
+    except OSError as e:
+        raise ValueError(f'STATE_PATH {state_path} cannot be created, set it to a writable folder: {e}') from e
+    if not os.access(state_path, os.W_OK):
+        raise ValueError(f'STATE_PATH {state_path} is not writable, set it to a writable folder')
+
+
+###################################################################################
+# migrate_chunked function runs a migration in chunks that fit in the time budget #
+# of an invocation. The portal is backed up one batch of dashboards at a time,    #
+# then the destinations are indexed concurrently, one batch of assets of each     #
+# destination per chunk, and their templates are written concurrently. The state #
+# is saved whenever less than time_margin_ms is left. It returns the continuation #
+# token to resume from, None once the templates are written. At least one chunk   #
+# is processed by each invocation                                                 #
+###################################################################################
+
+
+def migrate_chunked(parameters, get_remaining_time_in_millis, continuation_token=None):
+    max_workers = int(parameters.get('MAX_WORKERS', MAX_WORKERS))
+    time_margin_ms = int(parameters.get('TIME_MARGIN_MS', TIME_MARGIN_MS))
+    state_path = parameters.get('STATE_PATH', STATE_PATH)
+    prepare_state_path(state_path)
+
+    source_client = boto3.client('iotsitewise',
+                                 aws_access_key_id=parameters['SOURCE_AWS_SERVER_PUBLIC_KEY'],
+                                 aws_secret_access_key=parameters['SOURCE_AWS_SERVER_SECRET_KEY'],
+                                 region_name=parameters['SOURCE_REGION_NAME'])
+    resolvers = new_source_resolvers(source_client)
+    destinations = get_destinations(parameters)
+
+    if continuation_token:
+        if not isinstance(continuation_token, str) or not CONTINUATION_TOKEN_PATTERN.match(continuation_token):
+            raise ValueError(f'Invalid continuation token {continuation_token!r}')
+        state_file = join(state_path, '{}.json'.format(continuation_token))
+        if not os.path.exists(state_file):
+            raise ValueError(f'No state saved for continuation token {continuation_token} in {state_path}, '
+                             f'STATE_PATH must be kept between invocations')
+        state = load_state(state_file, resolvers)
+    else:
+        continuation_token = uuid.uuid4().hex
+        state_file = join(state_path, '{}.json'.format(continuation_token))
+        state = {'dashboard_ids': None, 'backed_up': 0,
+                 'destinations': [{'key': None, 'frontier': None, 'child_models_listed': False, 'indexed': False,
+                                   'templated': False}
+                                  for _ in destinations]}
+    spill_path = parameters.get('SPILL_PATH') or join(state_path, continuation_token)
+    index_paths = [destination.get('DESTINATION_INDEX_PATH') or
+                   join(state_path, '{}-index-{}.json'.format(continuation_token, destination_number))
+                   for destination_number, (destination, _) in enumerate(destinations)]
+    # indexes: destination number to index being built, kept in memory between the chunks of an invocation
+    indexes = {}
+
+    batches = 0
+
+    def out_of_time():
+        return batches > 0 and get_remaining_time_in_millis() < time_margin_ms
+
+    def checkpoint():
+        for destination_number, index in indexes.items():
+            save_destination_index(index, index_paths[destination_number] + '.partial')
+        save_state(state, state_file, resolvers)
+        return continuation_token
+
+    # back up the source dashboards, each one is spilled to disk as soon as it is backed up
+    if state['dashboard_ids'] is None:
+        state['dashboard_ids'] = list_dashboard_ids(source_client, parameters['SOURCE_PORTAL'])
+    while state['backed_up'] < len(state['dashboard_ids']):
+        if out_of_time():
+            return checkpoint()
+        batch = state['dashboard_ids'][state['backed_up']:state['backed_up'] + CHUNK_SIZE]
+        backup_dashboard_batch(source_client, batch, resolvers, max_workers, spill_path)
+        state['backed_up'] += len(batch)
+        batches += 1
+        logger.info(f'{state["backed_up"]}/{len(state["dashboard_ids"])} dashboards backed up')
+
+    # index the destinations concurrently, the crawl of each one goes on from its frontier: the assets left to index
+    # with their hierarchy paths, from the assets of the root model then from those of the child models
+    def index_destination_batch(destination_number):
+        destination = destinations[destination_number][0]
+        destination_state = state['destinations'][destination_number]
+        destination_client = create_destination_client(destination)
+        if destination_state['frontier'] is None:
+            destination_state['key'] = destination_index_key(destination)
+            if load_destination_index(index_paths[destination_number], destination_state['key'],
+                                      int(destination.get('DESTINATION_INDEX_MAX_AGE', INDEX_MAX_AGE))):
+                destination_state['indexed'] = True
+                return
+            indexes[destination_number] = new_destination_index()
+            destination_state['frontier'] = list_destination_model_assets(
+                destination_client, indexes[destination_number], [destination['DESTINATION_ROOT_MODEL_ID']],
+                max_workers)
+        elif destination_number not in indexes:
+            indexes[destination_number] = load_destination_index(index_paths[destination_number] + '.partial')
+
+        batch = destination_state['frontier'][:CHUNK_SIZE]
+        destination_state['frontier'] = destination_state['frontier'][CHUNK_SIZE:] + \
+            index_destination_assets(destination_client, indexes[destination_number], batch, max_workers)
+        # once the assets of the root model are crawled, crawl the assets of the child models it did not reach
+        if not destination_state['frontier'] and not destination_state['child_models_listed']:
+            destination_state['frontier'] = list_destination_model_assets(
+                destination_client, indexes[destination_number],
+                list_child_models(destination_client, destination['DESTINATION_ROOT_MODEL_ID']), max_workers)
+            destination_state['child_models_listed'] = True
+        if not destination_state['frontier']:
+            save_destination_index(indexes.pop(destination_number), index_paths[destination_number],
+                                   destination_state['key'])
+            if os.path.exists(index_paths[destination_number] + '.partial'):
+                os.remove(index_paths[destination_number] + '.partial')
+            destination_state['indexed'] = True
+
+    pending = [n for n, destination_state in enumerate(state['destinations']) if not destination_state['indexed']]
+    while pending:
+        if out_of_time():
+            return checkpoint()
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            list(executor.map(index_destination_batch, pending))
+        batches += 1
+        pending = [n for n, destination_state in enumerate(state['destinations']) if not destination_state['indexed']]
+        logger.info(f'{len(destinations) - len(pending)}/{len(destinations)} destinations indexed')
+
+    # map the dashboards and write the templates of the destinations concurrently, a destination is only started
+    # while enough time is left
+    pending = [n for n, destination_state in enumerate(state['destinations']) if not destination_state['templated']]
+    if pending and out_of_time():
+        return checkpoint()
+    dashboards = []
+    for dashboard_id in state['dashboard_ids'] if pending else []:
+        with open(join(spill_path, '{}.json'.format(dashboard_id))) as f:
+            dashboards.append(json.load(f))
+
+    def template_destination(destination_number):
+        if out_of_time():
+            return
+        destination, export_path = destinations[destination_number]
+        index = load_destination_index(index_paths[destination_number])
+        map_ids(dashboards, index)
+        create_cfn(create_destination_client(destination), destination['DESTINATION_PORTAL_NAME'],
+                   destination['DESTINATION_PROJECT_NAME'], dashboards, index, export_path)
+        state['destinations'][destination_number]['templated'] = True
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            list(executor.map(template_destination, pending))
+        batches += 1
+    if not all(destination_state['templated'] for destination_state in state['destinations']):
+        return checkpoint()
+
+    # the migration is complete, only the spilled dashboards and the indexes the user asked for are kept
+    if not parameters.get('SPILL_PATH'):
+        shutil.rmtree(spill_path, ignore_errors=True)
+    for (destination, _), index_path in zip(destinations, index_paths):
+        migration_files = [index_path + '.partial']
+        if not destination.get('DESTINATION_INDEX_PATH'):
+            migration_files.append(index_path)
+        for migration_file in migration_files:
+            if os.path.exists(migration_file):
+                os.remove(migration_file)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    return None
+
+
+###################################################################################
+# lambda_handler function migrates the portal in a single invocation, or in       #
+# chunks when the context tells the remaining time of the invocation: it returns  #
+# {'CONTINUATION_TOKEN': ...} until done, to pass in the event of the next        #
+# invocation, and {'CONTINUATION_TOKEN': None} once the templates are written      #
+###################################################################################
 
 
 def lambda_handler(event, context):
+    # the parameters are given in the context when testing locally, in the environment and the event on AWS Lambda
+    parameters = context if isinstance(context, dict) else {**os.environ, **(event or {})}
+
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        continuation_token = migrate_chunked(parameters, context.get_remaining_time_in_millis,
+                                             (event or {}).get('CONTINUATION_TOKEN'))
+        return {'CONTINUATION_TOKEN': continuation_token}
+
     # connect to source environment
     # boto3.setup_default_session(profile_name=context['source_environment'])
     source_client = boto3.client('iotsitewise',
-                                 aws_access_key_id=context['SOURCE_AWS_SERVER_PUBLIC_KEY'],
-                                 aws_secret_access_key=context['SOURCE_AWS_SERVER_SECRET_KEY'],
-                                 region_name=context['SOURCE_REGION_NAME'])
+                                 aws_access_key_id=parameters['SOURCE_AWS_SERVER_PUBLIC_KEY'],
+                                 aws_secret_access_key=parameters['SOURCE_AWS_SERVER_SECRET_KEY'],
+                                 region_name=parameters['SOURCE_REGION_NAME'])
 
-    backup_dashboards(source_client, context['SOURCE_PORTAL'])
+    max_workers = int(parameters.get('MAX_WORKERS', MAX_WORKERS))
+    dashboards = backup_dashboards(source_client, parameters['SOURCE_PORTAL'], max_workers,
+                                   parameters.get('SPILL_PATH'))
 
-    # switch context to destination environment
+    # switch context to destination environment(s), the source backup is shared by all of them
     # boto3.setup_default_session(profile_name=context['destination_environment'])
-    destination_client = boto3.client('iotsitewise',
-                                      aws_access_key_id=context['DESTINATION_AWS_SERVER_PUBLIC_KEY'],
-                                      aws_secret_access_key=context['DESTINATION_AWS_SERVER_SECRET_KEY'],
-                                      region_name=context['DESTINATION_REGION_NAME'])
-
-    generate_asset_property_dictionary(destination_client, context['DESTINATION_ROOT_MODEL_ID'])
-    map_ids()
-    create_cfn(destination_client, context['DESTINATION_PORTAL_NAME'], context['DESTINATION_PROJECT_NAME'])
+    destinations = get_destinations(parameters)
+    with ThreadPoolExecutor(max_workers=len(destinations)) as executor:
+        list(executor.map(lambda destination: migrate_destination(destination[0], dashboards, max_workers,
+                                                                  destination[1]),
+                          destinations))
 
 
 # For local testing
@@ -221,4 +831,21 @@ def lambda_handler(event, context):
 #                     'DESTINATION_REGION_NAME': '...',
 #                     'DESTINATION_ROOT_MODEL_ID': '...',
 #                     'DESTINATION_PORTAL_NAME': '...',
-#                     'DESTINATION_PROJECT_NAME': '...'})
+#                     'DESTINATION_PROJECT_NAME': '...',
+#                     'MAX_WORKERS': '10',
+#                     'SPILL_PATH': 'dashboards',
+#                     'DESTINATION_INDEX_PATH': 'destination_index.json'})
+#
+# Multiple destinations, the DESTINATION_* parameters are given for each of them
+# lambda_handler({}, {'SOURCE_AWS_SERVER_PUBLIC_KEY': '...',
+#                     'SOURCE_AWS_SERVER_SECRET_KEY': '...',
+#                     'SOURCE_REGION_NAME': '...',
+#                     'SOURCE_PORTAL': '...',
+#                     'DESTINATIONS': [{'DESTINATION_NAME': '...',
+#                                       'DESTINATION_AWS_SERVER_PUBLIC_KEY': '...',
+#                                       'DESTINATION_AWS_SERVER_SECRET_KEY': '...',
+#                                       'DESTINATION_REGION_NAME': '...',
+#                                       'DESTINATION_ROOT_MODEL_ID': '...',
+#                                       'DESTINATION_PORTAL_NAME': '...',
+#                                       'DESTINATION_PROJECT_NAME': '...'},
+#                                      {...}]})
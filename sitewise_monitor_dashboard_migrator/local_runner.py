@@ -0,0 +1,68 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+import export_dashboards
+
+logger = logging.getLogger()
+
+
+#############################################################################
+# LocalContext class holds the migration parameters, like the context of   #
+# the local testing lines of export_dashboards.py, and the remaining time   #
+# of a simulated Lambda invocation                                          #
+#############################################################################
+
+
+class LocalContext(dict):
+    def __init__(self, parameters, time_budget_ms):
+        super().__init__(parameters)
+        self.deadline = time.time() + time_budget_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.time()) * 1000))
+
+
+#############################################################################
+# run_migration function invokes lambda_handler with a new time budget and  #
+# the continuation token of the previous invocation until the migration is  #
+# complete, each invocation resuming from the state saved by the previous   #
+# one                                                                       #
+#############################################################################
+
+
+def run_migration(parameters, time_budget_ms, max_invocations=100):
+    event = {}
+    for invocation in range(1, max_invocations + 1):
+        start = time.time()
+        result = export_dashboards.lambda_handler(event, LocalContext(parameters, time_budget_ms))
+        logger.info(f'Invocation {invocation} ran for {time.time() - start:.1f}s, continuation token: '
+                    f'{result["CONTINUATION_TOKEN"]}')
+        if result['CONTINUATION_TOKEN'] is None:
+            return invocation
+        event = {'CONTINUATION_TOKEN': result['CONTINUATION_TOKEN']}
+    raise RuntimeError(f'Migration not complete after {max_invocations} invocations')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(module)s %(levelname)s: %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p',
+                        stream=sys.stdout)
+
+    parser = argparse.ArgumentParser(description='Runs the dashboard migration in chunks, as a Lambda function would')
+    parser.add_argument('parameters', help='JSON file of the lambda_handler parameters, i.e. SOURCE_PORTAL, ...')
+    parser.add_argument('--time-budget', type=float, default=900,
+                        help='Seconds of each simulated invocation (default: 900, the Lambda maximum)')
+    parser.add_argument('--max-invocations', type=int, default=100,
+                        help='Maximum number of invocations (default: 100)')
+    args = parser.parse_args()
+
+    with open(args.parameters) as f:
+        migration_parameters = json.load(f)
+    invocations = run_migration(migration_parameters, args.time_budget * 1000, args.max_invocations)
+    logger.info(f'Migration complete in {invocations} invocations')
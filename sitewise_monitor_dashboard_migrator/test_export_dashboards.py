@@ -0,0 +1,132 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Tests of the chunked migration against an in-memory SiteWise account, run with:
+# python3 -m unittest test_export_dashboards
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import export_dashboards
+import local_runner
+
+
+#############################################################################
+# FakeSiteWise class answers the SiteWise calls of a migration: portal P    #
+# with one project and two dashboards, and the sites S1 and S2 each with    #
+# a machine M1, which are both the source and the destination assets        #
+#############################################################################
+
+
+class FakePaginator:
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        yield self.operation(**kwargs)
+
+
+class FakeSiteWise:
+    models = {
+        'site': {'assetModelHierarchies': [{'id': 'machines', 'childAssetModelId': 'machine'}]},
+        'machine': {'assetModelHierarchies': []}
+    }
+    # asset id: (name, model id, parent id)
+    assets = {'s1': ('S1', 'site', None), 's2': ('S2', 'site', None),
+              'm1': ('M1', 'machine', 's1'), 'm2': ('M1', 'machine', 's2')}
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(getattr(self, operation_name))
+
+    def get_caller_identity(self):
+        return {'Account': '123456789012'}
+
+    def list_portals(self):
+        return {'portalSummaries': [{'id': 'portal', 'name': 'P'}]}
+
+    def list_projects(self, portalId):
+        return {'projectSummaries': [{'id': 'project', 'name': 'Proj'}]}
+
+    def list_dashboards(self, projectId):
+        return {'dashboardSummaries': [{'id': 'd1'}, {'id': 'd2'}]}
+
+    def describe_dashboard(self, dashboardId):
+        metrics = [{'assetId': 'm1', 'propertyId': 'temp-m1'}, {'assetId': 'm2', 'propertyId': 'temp-m2'}]
+        return {'dashboardId': dashboardId, 'dashboardName': 'Dashboard ' + dashboardId,
+                'dashboardDescription': 'd', 'dashboardCreationDate': None, 'dashboardLastUpdateDate': None,
+                'dashboardDefinition': json.dumps({'widgets': [{'metrics': metrics}]})}
+
+    def describe_asset_property(self, assetId, propertyId):
+        return {'assetName': self.assets[assetId][0], 'assetProperty': {'name': 'Temp'}}
+
+    def describe_asset_model(self, assetModelId):
+        return self.models[assetModelId]
+
+    def list_assets(self, assetModelId, filter):
+        return {'assetSummaries': [{'id': asset_id, 'name': name}
+                                   for asset_id, (name, model_id, _) in self.assets.items()
+                                   if model_id == assetModelId]}
+
+    def describe_asset(self, assetId):
+        name, model_id, _ = self.assets[assetId]
+        return {'assetProperties': [{'id': 'temp-' + assetId, 'name': 'Temp'}],
+                'assetHierarchies': [{'id': hierarchy['id']}
+                                     for hierarchy in self.models[model_id]['assetModelHierarchies']]}
+
+    def list_associated_assets(self, assetId, traversalDirection, hierarchyId=None):
+        if traversalDirection == 'PARENT':
+            parent_id = self.assets[assetId][2]
+            return {'assetSummaries': [{'id': parent_id, 'name': self.assets[parent_id][0]}] if parent_id else []}
+        return {'assetSummaries': [{'id': asset_id, 'name': name}
+                                   for asset_id, (name, _, parent_id) in self.assets.items() if parent_id == assetId]}
+
+
+class ChunkedMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        self.state_path = os.path.join(self.directory.name, 'state')
+        self.parameters = {
+            'SOURCE_AWS_SERVER_PUBLIC_KEY': 'k', 'SOURCE_AWS_SERVER_SECRET_KEY': 's', 'SOURCE_REGION_NAME': 'r',
+            'SOURCE_PORTAL': 'P',
+            'DESTINATION_AWS_SERVER_PUBLIC_KEY': 'k', 'DESTINATION_AWS_SERVER_SECRET_KEY': 's',
+            'DESTINATION_REGION_NAME': 'r', 'DESTINATION_ROOT_MODEL_ID': 'site', 'DESTINATION_PORTAL_NAME': 'P',
+            'DESTINATION_PROJECT_NAME': 'Proj',
+            # a single batch per invocation
+            'TIME_MARGIN_MS': 10 ** 9, 'STATE_PATH': self.state_path
+        }
+        patches = [mock.patch.object(export_dashboards.boto3, 'client', return_value=FakeSiteWise()),
+                   mock.patch.object(export_dashboards, 'CHUNK_SIZE', 1)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_state_path_empty_after_last_invocation(self):
+        invocations = local_runner.run_migration(self.parameters, 1000)
+
+        self.assertGreater(invocations, 1)
+        self.assertEqual(os.listdir(self.state_path), [])
+        with open(os.path.join('cfnexport', 'dashboards_cfn.json')) as f:
+            self.assertEqual(len(json.load(f)['Resources']), 2)
+
+    def test_user_paths_kept_after_last_invocation(self):
+        spill_path = os.path.join(self.directory.name, 'dashboards')
+        index_path = os.path.join(self.directory.name, 'index.json')
+        local_runner.run_migration({**self.parameters, 'SPILL_PATH': spill_path,
+                                    'DESTINATION_INDEX_PATH': index_path}, 1000)
+
+        self.assertEqual(os.listdir(self.state_path), [])
+        self.assertEqual(sorted(os.listdir(spill_path)), ['d1.json', 'd2.json'])
+        self.assertTrue(os.path.exists(index_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Measures the cold start of the dashboard tools. Each scenario is run in a fresh python
+# process and the median wall time is reported. "eager client" is the fixed cost the tools
+# used to pay on every invocation (importing boto3 and building a client before parsing
+# the arguments), which --help and module imports no longer pay.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = [
+    ('python startup', ['-c', 'pass']),
+    ('eager client', ['-c', "import boto3; from botocore.config import Config; "
+                            "boto3.client('iotsitewise', config=Config(region_name='us-east-1'))"]),
+    ('import copy tool', ['-c', 'import sitewise_dashboard_copy']),
+    ('import replicator', ['-c', 'import sitewise_dashboard_replicator']),
+    ('copy tool --help', [os.path.join(TOOLS_DIR, 'sitewise_dashboard_copy.py'), '--help']),
+    ('replicator --help', [os.path.join(TOOLS_DIR, 'sitewise_dashboard_replicator.py'), '--help']),
+]
+
+def time_scenario(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + command, cwd=TOOLS_DIR, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None
+    return statistics.median(timings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dashboard tools startup benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='Number of runs of each scenario')
+    args = parser.parse_args()
+
+    results = {}
+    for name, command in SCENARIOS:
+        results[name] = time_scenario(command, args.runs)
+        print('{:<20} {}'.format(name, 'failed' if results[name] is None else '{:8.1f} ms'.format(results[name] * 1000)))
+
+    if results['eager client'] and results['copy tool --help']:
+        print('--help is {:.1f}x faster than building the client eagerly'.format(
+            results['eager client'] / results['copy tool --help']))
@@ -0,0 +1,18 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Reusable AWS IoT SiteWise client factory shared by the dashboard tools.
+# boto3 is only imported the first time a client is requested, so argument parsing and
+# --help never pay its import cost, and clients are cached per profile/region/pool size
+# so a warm process (or a Lambda container) builds each of them once.
+
+import functools
+
+@functools.lru_cache(maxsize=None)
+def get_client(profile=None, region=None, max_pool_connections=10):
+    import boto3
+    from botocore.config import Config
+
+    session = boto3.Session(profile_name=profile) if profile else boto3.Session()
+    my_config = Config(region_name=region, max_pool_connections=max_pool_connections)
+    return session.client('iotsitewise', config=my_config)
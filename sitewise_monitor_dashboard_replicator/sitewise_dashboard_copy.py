@@ -2,74 +2,105 @@
 
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
-import boto3
 import argparse
-from botocore.config import Config
-
-parser = argparse.ArgumentParser(description='SiteWise Dashboard Copy Tool')
-parser.add_argument('--profile', action='store', help='Credentials profile for the AWS account')
-parser.add_argument('--region', action='store', help='Specify the AWS region you would like to target')
-subparsers = parser.add_subparsers(dest='cmd')
-
-parser_dash_list = subparsers.add_parser('list_dashboards', help='Command to list dashboards in the region avaliable to copy')
-parser_proj_list = subparsers.add_parser('list_projects',  help='Command to list the projects avaliable to copy a dashboard to')
-parser_dash_copy = subparsers.add_parser('copy_dashboard', help='Command to copy dashboard to specified project')
-parser_dash_copy.add_argument('--dashboard_id', type=str, required=True, help='Enter the source Dashboard ID you want to copy')
-parser_dash_copy.add_argument('--project_id', type=str, help='Enter the target Project ID you want to copy the dashboard to')
-parser_dash_copy.add_argument('--print_definition', action='store_true', help='if you only want the dashboard JSON definition instead of copying')
-
-args = parser.parse_args()
-
-#Setup the AWS SiteWise boto3 client
-if args.profile:
-    boto3.setup_default_session(profile_name=args.profile)
-if args.region:
-    my_config = Config(region_name=args.region)
-else:
-    my_config = Config()
-client = boto3.client('iotsitewise', config=my_config)
-
-def list_portals():
-    portals = []
-    portals_paginator = client.get_paginator("list_portals")
-    pages = portals_paginator.paginate()
-    for page in pages:
-        if page['portalSummaries']:
-            for portal in page['portalSummaries']:
-                portals.append({'id': portal['id'], 'name': portal['name']})
-    return portals
-
-def list_projects(portal_id):
-    projects = []
-    projects_paginator = client.get_paginator("list_projects")
-    pages = projects_paginator.paginate(portalId=portal_id)
-    for page in pages:
-        if page['projectSummaries']:
-            for project in page['projectSummaries']:
-                # if project['name'] == '{templates}':
-                projects.append({'name':project['name'], "id": project['id']})
-    return projects
-
-def list_dashboards(project_id):
-    dashboards = []
-    dashboard_paginator = client.get_paginator("list_dashboards")
-    pages = dashboard_paginator.paginate(projectId=project_id)
-    for page in pages:
-        if page['dashboardSummaries']:
-            for dashboard in page['dashboardSummaries']:
-                dashboards.append({'name':dashboard['name'], "id": dashboard['id'], 'project_id': project_id})
-    return dashboards
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+import sitewise_client
+import sitewise_inventory
 
+#The AWS SiteWise boto3 client, built by main() once the command is known to need it
+client = None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SiteWise Dashboard Copy Tool')
+    parser.add_argument('--profile', action='store', help='Credentials profile for the AWS account')
+    parser.add_argument('--region', action='store', help='Specify the AWS region you would like to target')
+    parser.add_argument('--snapshot', action='store', help='Local inventory snapshot file, list commands read it instead of calling SiteWise when it exists')
+    parser.add_argument('--refresh', action='store_true', help='Crawl SiteWise again and overwrite the --snapshot file')
+    parser.add_argument('--workers', type=int, default=sitewise_inventory.MAX_WORKERS, help='Number of concurrent SiteWise calls')
+    subparsers = parser.add_subparsers(dest='cmd')
+
+    parser_dash_list = subparsers.add_parser('list_dashboards', help='Command to list dashboards in the region avaliable to copy')
+    parser_proj_list = subparsers.add_parser('list_projects',  help='Command to list the projects avaliable to copy a dashboard to')
+    parser_dash_copy = subparsers.add_parser('copy_dashboard', help='Command to copy dashboard to specified project')
+    parser_dash_copy.add_argument('--dashboard_id', type=str, required=True, help='Enter the source Dashboard ID you want to copy')
+    parser_dash_copy.add_argument('--project_id', type=str, help='Enter the target Project ID you want to copy the dashboard to')
+    parser_dash_copy.add_argument('--print_definition', action='store_true', help='if you only want the dashboard JSON definition instead of copying')
+    parser_batch_copy = subparsers.add_parser('copy_dashboards', help='Command to copy many dashboards to their target projects in one run')
+    batch_source_group = parser_batch_copy.add_mutually_exclusive_group(required=True)
+    batch_source_group.add_argument('--manifest', type=str, help='CSV or JSON file of dashboard_id,project_id pairs to copy')
+    batch_source_group.add_argument('--source_project_id', type=str, help='Copy every dashboard of this project')
+    parser_batch_copy.add_argument('--project_id', type=str, nargs='+', help='Target Project ID(s) for the dashboards of --source_project_id')
+    parser_batch_copy.add_argument('--report', type=str, help='Write the result of each copy to this CSV or JSON file')
+
+    args = parser.parse_args(argv)
+    if args.cmd == 'copy_dashboards' and args.source_project_id and not args.project_id:
+        parser.error('--project_id is required with --source_project_id')
+    return args
+
+def read_manifest(manifest):
+    with open(manifest) as f:
+        if manifest.endswith('.json'):
+            return [(job['dashboard_id'], job['project_id']) for job in json.load(f)]
+        return [(row['dashboard_id'], row['project_id']) for row in csv.DictReader(f)]
+
+def describe_dashboard(dashboard_id):
+    try:
+        return client.describe_dashboard(dashboardId=dashboard_id)
+    except Exception as e:
+        return e
+
+def copy_dashboard(dash_details, dashboard_id, project_id):
+    result = {'dashboard_id': dashboard_id, 'project_id': project_id, 'new_dashboard_id': '', 'status': 'FAILED', 'error': ''}
+    if isinstance(dash_details, Exception):
+        result['error'] = str(dash_details)
+        return result
+    try:
+        response = client.create_dashboard(
+                projectId=project_id,
+                dashboardName=dash_details['dashboardName'],
+                dashboardDescription=dash_details.get('dashboardDescription', dash_details['dashboardName']),
+                dashboardDefinition=dash_details['dashboardDefinition'],
+            )
+        result.update({'new_dashboard_id': response['dashboardId'], 'status': 'COPIED'})
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+def copy_dashboards(jobs, workers):
+    #Each source dashboard is described once, no matter how many projects it is copied to
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        source_ids = list(dict.fromkeys(dashboard_id for dashboard_id, project_id in jobs))
+        details = dict(zip(source_ids, executor.map(describe_dashboard, source_ids)))
+        return list(executor.map(lambda job: copy_dashboard(details[job[0]], *job), jobs))
+
+def write_report(report, path):
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.json'):
+            json.dump(report, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=['dashboard_id', 'project_id', 'new_dashboard_id', 'status', 'error'])
+            writer.writeheader()
+            writer.writerows(report)
+
+def main(argv=None):
+    global client
+    args = parse_args(argv)
+    if not args.cmd:
+        return
+
+    #Setup the AWS SiteWise boto3 client, one client is shared by all the worker threads
+    #and its connection pool is sized to match them
+    client = sitewise_client.get_client(args.profile, args.region, max(args.workers, 10))
 
-if __name__ == '__main__':
     if args.cmd == 'list_dashboards' or args.cmd == 'list_projects':
-        for portal in list_portals():
-            for project in list_projects(portal['id']):
-                if args.cmd == 'list_projects':
-                    print(project)
-                    break
-                for dashboard in list_dashboards(project['id']):
-                    print(dashboard)
+        item_type = 'dashboard' if args.cmd == 'list_dashboards' else 'project'
+        for item in sitewise_inventory.crawl(client, include_dashboards=args.cmd == 'list_dashboards',
+                                             max_workers=args.workers, snapshot=args.snapshot, refresh=args.refresh,
+                                             profile=args.profile):
+            if item['type'] == item_type:
+                print({k: v for k, v in item.items() if k not in ('type', 'portal_id')})
 
     if args.cmd == 'copy_dashboard':
         dash_id = args.dashboard_id
@@ -87,4 +118,22 @@ if __name__ == '__main__':
                     dashboardDescription=dashboard_description,
                     dashboardDefinition=dashboard_definition,
                 )
-            print(response)
\ No newline at end of file
+            print(response)
+
+    if args.cmd == 'copy_dashboards':
+        if args.manifest:
+            jobs = read_manifest(args.manifest)
+        else:
+            jobs = [(dashboard['id'], project_id)
+                    for dashboard in sitewise_inventory.list_dashboards(client, args.source_project_id)
+                    for project_id in args.project_id]
+        report = copy_dashboards(jobs, args.workers)
+        if args.report:
+            write_report(report, args.report)
+        for result in report:
+            if result['status'] != 'COPIED':
+                print(result)
+        print('Copied {} of {} dashboards'.format(sum(1 for result in report if result['status'] == 'COPIED'), len(report)))
+
+if __name__ == '__main__':
+    main()
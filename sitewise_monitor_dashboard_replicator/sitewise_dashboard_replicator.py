@@ -3,67 +3,34 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import boto3
 import json
 import re
 import argparse
-from botocore.config import Config
-
-parser = argparse.ArgumentParser(description='SiteWise Dashboard Replicator')
-
-parser.add_argument('--profile', action='store', help='Credentials profile for the AWS account')
-parser.add_argument('--region', action='store', help='Specify the AWS region you would like to target')
-source_group = parser.add_mutually_exclusive_group(required=True)
-source_group.add_argument('--all',action='store_true', help='Replicate all dashboards with source tag')
-source_group.add_argument('--dashboard_id',action='store', help='Replicate individual dashboard by ID')
-parser.add_argument('--source_tag', action='store', help='provide a custom source dashboard tag')
-args = parser.parse_args()
-
-#Setup the AWS SiteWise boto3 client
-if args.profile:
-    boto3.setup_default_session(profile_name=args.profile)
-if args.region:
-    my_config = Config(region_name=args.region)
-else:
-    my_config = Config()
-client = boto3.client('iotsitewise', config=my_config)
-
-#Setup the source dashbard name identifier tag 
-if args.source_tag:
-    source_tag = args.source_tag
-else:
-    source_tag = "{source}"
-
-def list_portals():
-    portals = []
-    portals_paginator = client.get_paginator("list_portals")
-    pages = portals_paginator.paginate()
-    for page in pages:
-        if page['portalSummaries']:
-            for portal in page['portalSummaries']:
-                portals.append(portal['id'])
-    return portals
-
-def list_projects(portal_id):
-    projects = []
-    projects_paginator = client.get_paginator("list_projects")
-    pages = projects_paginator.paginate(portalId=portal_id)
-    for page in pages:
-        if page['projectSummaries']:
-            for project in page['projectSummaries']:
-                # if project['name'] == '{templates}':
-                projects.append({"id": project['id'], 'name':project['name']})
-    return projects
+import sitewise_client
+import sitewise_inventory
+
+#The AWS SiteWise boto3 client, built by main() after the arguments are parsed
+client = None
+
+#The source dashbard name identifier tag
+source_tag = "{source}"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SiteWise Dashboard Replicator')
+
+    parser.add_argument('--profile', action='store', help='Credentials profile for the AWS account')
+    parser.add_argument('--region', action='store', help='Specify the AWS region you would like to target')
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--all',action='store_true', help='Replicate all dashboards with source tag')
+    source_group.add_argument('--dashboard_id',action='store', help='Replicate individual dashboard by ID')
+    parser.add_argument('--source_tag', action='store', help='provide a custom source dashboard tag')
+    parser.add_argument('--snapshot', action='store', help='Local inventory snapshot file, --all reads it instead of listing SiteWise when it exists')
+    parser.add_argument('--refresh', action='store_true', help='Crawl SiteWise again and overwrite the --snapshot file')
+    parser.add_argument('--workers', type=int, default=sitewise_inventory.MAX_WORKERS, help='Number of concurrent SiteWise list calls')
+    return parser.parse_args(argv)
 
 def list_dashboards(project_id):
-    dashboards = []
-    dashboard_paginator = client.get_paginator("list_dashboards")
-    pages = dashboard_paginator.paginate(projectId=project_id)
-    for page in pages:
-        if page['dashboardSummaries']:
-            for dashboard in page['dashboardSummaries']:
-                dashboards.append({"id": dashboard['id'], 'name':dashboard['name']})
-    return dashboards
+    return sitewise_inventory.list_dashboards(client, project_id)
 
 def list_assets(assetModelId):
     asset_list = []
@@ -189,15 +156,27 @@ def dashboard_sync(dashboard):
                 print('Dashboard create success:')
                 print('- Name: '+name_merge)
 
-if __name__ == '__main__':
+def main(argv=None):
+    global client, source_tag
+    args = parse_args(argv)
+
+    #Setup the AWS SiteWise boto3 client
+    client = sitewise_client.get_client(args.profile, args.region, max(args.workers, 10))
+
+    #Setup the source dashbard name identifier tag
+    if args.source_tag:
+        source_tag = args.source_tag
+
     if args.all:
-        for portal in list_portals():
-            for project in list_projects(portal):
-                for dashboard in list_dashboards(project['id']):
-                    if source_tag in dashboard['name']:
-                        source = get_source_dashboard(dashboard['id'])
-                        dashboard_sync(source)
+        for dashboard in sitewise_inventory.crawl(client, max_workers=args.workers, snapshot=args.snapshot,
+                                                  refresh=args.refresh, profile=args.profile):
+            if dashboard['type'] == 'dashboard' and source_tag in dashboard['name']:
+                source = get_source_dashboard(dashboard['id'])
+                dashboard_sync(source)
 
     if args.dashboard_id:
         source = get_source_dashboard(args.dashboard_id)
         dashboard_sync(source)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Portal/project/dashboard inventory crawler shared by the dashboard tools.
+# Projects and dashboards are listed concurrently per portal and project, and each
+# item is yielded as soon as it is listed. The inventory can be persisted to a local
+# snapshot file (one JSON item per line) that later runs read instead of calling SiteWise.
+# Its first line tells the profile and region it was crawled from, a snapshot is only read
+# by runs targeting the same ones.
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+MAX_WORKERS = 10
+
+def list_portals(client):
+    portals = []
+    portals_paginator = client.get_paginator("list_portals")
+    pages = portals_paginator.paginate()
+    for page in pages:
+        if page['portalSummaries']:
+            for portal in page['portalSummaries']:
+                portals.append({'type': 'portal', 'id': portal['id'], 'name': portal['name']})
+    return portals
+
+def list_projects(client, portal_id):
+    projects = []
+    projects_paginator = client.get_paginator("list_projects")
+    pages = projects_paginator.paginate(portalId=portal_id)
+    for page in pages:
+        if page['projectSummaries']:
+            for project in page['projectSummaries']:
+                projects.append({'type': 'project', 'name': project['name'], 'id': project['id'], 'portal_id': portal_id})
+    return projects
+
+def list_dashboards(client, project_id):
+    dashboards = []
+    dashboard_paginator = client.get_paginator("list_dashboards")
+    pages = dashboard_paginator.paginate(projectId=project_id)
+    for page in pages:
+        if page['dashboardSummaries']:
+            for dashboard in page['dashboardSummaries']:
+                dashboards.append({'type': 'dashboard', 'name': dashboard['name'], 'id': dashboard['id'], 'project_id': project_id})
+    return dashboards
+
+def crawl_sitewise(client, include_dashboards=True, max_workers=MAX_WORKERS):
+    #Yield portals, then their projects and dashboards as soon as each listing call completes
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for portal in list_portals(client):
+            yield portal
+            pending.add(executor.submit(list_projects, client, portal['id']))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for item in future.result():
+                    yield item
+                    if item['type'] == 'project' and include_dashboards:
+                        pending.add(executor.submit(list_dashboards, client, item['id']))
+
+def snapshot_header(client, profile=None):
+    #The region is the one the client resolved, so a default region is recorded too
+    return {'type': 'snapshot', 'profile': profile, 'region': client.meta.region_name}
+
+def load_snapshot(snapshot, header):
+    with open(snapshot) as f:
+        first_line = f.readline()
+        saved_header = json.loads(first_line) if first_line else None
+        if saved_header != header:
+            found = 'no profile and region' if not saved_header or saved_header.get('type') != 'snapshot' else \
+                'profile {} and region {}'.format(saved_header.get('profile') or 'default', saved_header.get('region'))
+            raise ValueError('Snapshot {} was saved for {}, not profile {} and region {}, use --refresh to crawl them '
+                             'again or another --snapshot file'.format(snapshot, found, header['profile'] or 'default',
+                                                                       header['region']))
+        for line in f:
+            yield json.loads(line)
+
+def crawl(client, include_dashboards=True, max_workers=MAX_WORKERS, snapshot=None, refresh=False, profile=None):
+    #Yield the inventory from the snapshot if there is one, otherwise crawl SiteWise and save it to the snapshot
+    header = snapshot_header(client, profile)
+    if snapshot and os.path.exists(snapshot) and not refresh:
+        for item in load_snapshot(snapshot, header):
+            if include_dashboards or item['type'] != 'dashboard':
+                yield item
+        return
+
+    if not snapshot:
+        yield from crawl_sitewise(client, include_dashboards, max_workers)
+        return
+
+    #Only complete crawls including dashboards are saved, a partial snapshot is never left behind,
+    #even when the consumer stops early or fails
+    tmp_snapshot = snapshot + '.tmp'
+    try:
+        with open(tmp_snapshot, 'w') as f:
+            f.write(json.dumps(header) + '\n')
+            for item in crawl_sitewise(client, True, max_workers):
+                f.write(json.dumps(item) + '\n')
+                if include_dashboards or item['type'] != 'dashboard':
+                    yield item
+        os.replace(tmp_snapshot, snapshot)
+    finally:
+        if os.path.exists(tmp_snapshot):
+            os.remove(tmp_snapshot)